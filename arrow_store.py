@@ -0,0 +1,136 @@
+import hashlib
+import os
+import shutil
+
+import backends
+import calendar_dim
+import compact
+import star_schema
+from instrument import span
+from loader import CACHE_DIR, workbook_fingerprint
+
+try:
+    import pyarrow as pa
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+STORE_DIR = '.fact_store'
+
+# The enriched sales fact table (joined, derived columns, compacted), kept
+# on disk as uncompressed Arrow IPC files so any process can memory-map it
+# instead of loading and joining the workbook again:
+#
+#     .fact_store/<key>/sales.arrow           the fact table
+#     .fact_store/<key>/unmatched.arrow       unmatched join keys
+#     .fact_store/<key>/memory_report.arrow   compact_fact_table's report
+#
+# The key hashes the workbook fingerprint, the backends.py engine that did
+# the join and the source of the modules that shape the table, so a changed
+# workbook, engine or join/derive/compact code writes a new store (and the
+# old one is removed). open_table() maps the file and
+# returns a pyarrow.Table whose buffers point into the page cache; several
+# report processes opening it share one copy in memory.
+
+TABLES = ['sales', 'unmatched', 'memory_report']
+
+
+def _source_digest(module):
+    with open(module.__file__, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def store_key(workbook, cache_dir=CACHE_DIR, backend=None):
+    # `backend` names the backends.py engine of the join; None is the star
+    # schema's own join
+    digest = hashlib.sha256(workbook_fingerprint(workbook, cache_dir)['key'].encode())
+    modules = (star_schema, calendar_dim, compact) if backend is None else (star_schema, calendar_dim, compact, backends)
+    for module in modules:
+        digest.update(_source_digest(module).encode())
+    digest.update(f'backend={backend}'.encode())
+    return digest.hexdigest()[:16]
+
+
+def store_path(workbook, store_dir=STORE_DIR, cache_dir=CACHE_DIR, backend=None):
+    return os.path.join(store_dir, store_key(workbook, cache_dir, backend))
+
+
+def _write_ipc(frame, path, preserve_index):
+    table = pa.Table.from_pandas(frame, preserve_index=preserve_index)
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def open_table(path):
+    # pyarrow.Table over the memory-mapped file; no column is copied
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def write_fact_table(workbook, sales, unmatched, memory_report, store_dir=STORE_DIR, cache_dir=CACHE_DIR,
+                     backend=None):
+    # Store the tables for this workbook, code and backend; returns the store
+    # directory (None without pyarrow)
+    if not HAVE_PYARROW:
+        return None
+    path = store_path(workbook, store_dir, cache_dir, backend)
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    with span('write fact store', 'store', rows_in=len(sales)):
+        _write_ipc(sales, os.path.join(tmp, 'sales.arrow'), preserve_index=False)
+        _write_ipc(unmatched, os.path.join(tmp, 'unmatched.arrow'), preserve_index=False)
+        _write_ipc(memory_report, os.path.join(tmp, 'memory_report.arrow'), preserve_index=True)
+
+    # Only the latest store is kept; processes that still map an old one keep
+    # reading it until they close it. *.tmp directories are stores another
+    # process is still writing, and are left alone.
+    for name in os.listdir(store_dir):
+        stale = os.path.join(store_dir, name)
+        if not name.endswith('.tmp') and os.path.isdir(stale):
+            shutil.rmtree(stale, ignore_errors=True)
+    os.replace(tmp, path)
+    return path
+
+
+def open_fact_table(workbook, store_dir=STORE_DIR, cache_dir=CACHE_DIR, backend=None):
+    # {'sales', 'unmatched', 'memory_report'} as DataFrames if a store for
+    # the workbook's current contents (joined by `backend`) exists, else None.
+    # Numeric columns of 'sales' are read-only views of the mapped file.
+    if not HAVE_PYARROW:
+        return None
+    path = store_path(workbook, store_dir, cache_dir, backend)
+    if not all(os.path.exists(os.path.join(path, f'{name}.arrow')) for name in TABLES):
+        return None
+    tables = {}
+    with span('open fact store', 'store') as s:
+        for name in TABLES:
+            table = open_table(os.path.join(path, f'{name}.arrow'))
+            tables[name] = table.to_pandas(split_blocks=True)
+        s.rows_out = len(tables['sales'])
+    return tables
+
+
+def fact_rows(workbook, frames=None, store_dir=STORE_DIR, cache_dir=CACHE_DIR, backend=None):
+    # The enriched fact table for the workbook, from the store or built and
+    # stored: returns (tables as in open_fact_table, True if reused). With a
+    # `backend` name the join runs on that backends.py engine instead of the
+    # star schema's own join.
+    tables = open_fact_table(workbook, store_dir, cache_dir, backend)
+    if tables is not None:
+        return tables, True
+    if frames is None:
+        from loader import load_workbook
+        frames, _ = load_workbook(workbook, cache_dir=cache_dir)
+    schema = star_schema.build_sales_schema(frames)
+    if backend is None:
+        sales = schema.frame(frames['Sales Orders'].columns.tolist() + star_schema.SALES_ATTRIBUTES)
+    else:
+        sales = backends.get_backend(backend).join(frames)
+    unmatched = schema.unmatched()
+    star_schema.add_derived_columns(sales)
+    sales, memory_report = compact.compact_fact_table(sales)
+    tables = {'sales': sales, 'unmatched': unmatched, 'memory_report': memory_report}
+    write_fact_table(workbook, sales, unmatched, memory_report, store_dir, cache_dir, backend)
+    return tables, False
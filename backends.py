@@ -0,0 +1,390 @@
+import argparse
+import importlib.util
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import compact
+import metrics
+import star_schema
+from cube import CUBE_DIMENSIONS, CUBE_MEASURES, SalesCube
+from instrument import span
+from parallel import build_cube, decode_column, decode_key, encode_column, encode_key
+from validate import JOINS
+
+# Execution backends for the row-level work of eda.py: the joins of Steps
+# 1-2 and the groupbys every later table comes from. The analysis itself is
+# written once, in metrics.py, against the SalesCube; a backend only has to
+# produce that cube and the inputs around it:
+#
+#   join(frames)            Sales Orders with SALES_ATTRIBUTES attached by left
+#                           joins (as star_schema.build_sales_schema)
+#   cube(rows, ...)         a SalesCube with the cells of SalesCube.build()
+#   orders_by_region(rows)  distinct orders per region
+#
+#   pandas   star_schema's positional joins and the (parallel) cube build
+#   duckdb   the same joins and groupbys as SQL on an in-process connection,
+#            exchanging data as Arrow tables
+#   polars   the same as a lazy query, run by the multi-threaded engine
+#
+# DuckDB and Polars group on integer codes made by pandas (encode_key), so
+# cells come back in groupby order and decode to the same labels and dtypes;
+# their joined columns are cast back to the workbook's dtypes. The results
+# differ from pandas only in the last digits of float sums, as pandas adds
+# with compensated summation (DuckDB uses fsum, its Kahan sum). The joins
+# assume unique dimension keys, which validate.py checks; pandas refuses
+# duplicates where a SQL join would repeat the sales rows.
+#
+# parity() runs every backend on the same workbook and compares the joined
+# rows, the cube and every metrics table; main() times them.
+#
+# DuckDB and Polars are optional and only imported when their backend is
+# created, so a pandas run does not pay for loading them.
+
+BACKENDS = ['pandas', 'duckdb', 'polars']
+FACT_TABLE = 'Sales Orders'
+PARITY_RTOL = 1e-9
+# Packages each backend needs beyond pandas
+BACKEND_MODULES = {'pandas': [], 'duckdb': ['duckdb', 'pyarrow'], 'polars': ['polars', 'pyarrow']}
+
+
+def available_backends():
+    # Backends whose packages are installed, found without importing them
+    return [name for name in BACKENDS
+            if all(importlib.util.find_spec(module) is not None for module in BACKEND_MODULES[name])]
+
+
+def join_plan(frames, attributes=star_schema.SALES_ATTRIBUTES, joins=JOINS, fact=FACT_TABLE):
+    # (joins needed for the attributes, as (table, foreign key, dimension, key,
+    # [dimension columns kept]) in order; {attribute: (dimension, column)})
+    owners = {}
+    for _, _, dimension, key in joins:
+        for attribute in attributes:
+            if attribute not in owners and attribute != key and attribute in frames[dimension].columns:
+                owners[attribute] = dimension
+    missing = [a for a in attributes if a not in owners]
+    if missing:
+        raise KeyError(f"No joined sheet has the attributes {missing}")
+
+    plan = []
+    for i, (table, foreign_key, dimension, key) in enumerate(joins):
+        # Keep a dimension's attributes and the keys later joins start from
+        keep = [a for a in attributes if owners[a] == dimension]
+        keep += [fk for t, fk, _, _ in joins[i + 1:] if t == dimension and fk not in keep]
+        if keep:
+            plan.append((table, foreign_key, dimension, key, keep))
+    needed = {fact} | {dimension for _, _, dimension, _, _ in plan}
+    plan = [step for step in plan if step[0] in needed]
+    return plan, {attribute: (owners[attribute], attribute) for attribute in attributes}
+
+
+def _conform(rows, frames, owners, fact=FACT_TABLE):
+    # Cast joined columns back to the sheets' dtypes; integers with missing
+    # values become float64, as in a pandas left join
+    for column in rows.columns:
+        if column in owners:
+            dimension, source = owners[column]
+            dtype = frames[dimension][source].dtype
+        else:
+            dtype = frames[fact][column].dtype
+        if rows[column].dtype == dtype:
+            continue
+        if (pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype)) and rows[column].isna().any():
+            dtype = np.float64
+        rows[column] = rows[column].astype(dtype)
+    return rows
+
+
+class PandasBackend:
+    name = 'pandas'
+
+    def __init__(self, workers=1, partition_by='Product Name'):
+        self.workers = workers
+        self.partition_by = partition_by
+
+    def join(self, frames):
+        schema = star_schema.build_sales_schema(frames)
+        return schema.frame(frames[FACT_TABLE].columns.tolist() + star_schema.SALES_ATTRIBUTES)
+
+    def cube(self, rows, dimensions=CUBE_DIMENSIONS, measures=CUBE_MEASURES, first=('households',)):
+        return build_cube(rows, self.workers, self.partition_by, dimensions, measures, first)
+
+    def orders_by_region(self, rows):
+        return metrics.orders_by_region(rows)
+
+
+class EngineBackend:
+    # Shared encoding and decoding around an engine's _join, _aggregate and
+    # _distinct_counts
+
+    name = None
+
+    def join(self, frames):
+        plan, owners = join_plan(frames)
+        sales = frames[FACT_TABLE]
+        with span(f'{self.name} join', 'join', rows_in=len(sales)) as s:
+            rows = self._join(frames, plan, owners)
+            rows = _conform(rows, frames, owners)
+            s.rows_out = len(rows)
+        return rows
+
+    def cube(self, rows, dimensions=CUBE_DIMENSIONS, measures=CUBE_MEASURES, first=('households',)):
+        dimensions = list(dimensions)
+        measures = list(measures)
+        first = [c for c in first if c in rows.columns]
+        with span(f'{self.name} cube build', 'groupby', rows_in=len(rows)) as s:
+            data = {}
+            decoders = {}
+            for i, dimension in enumerate(dimensions):
+                # Missing values sort last as a code of their own, so rows
+                # with an orphan key or no date keep their cell
+                codes, decoders[dimension], _ = encode_key(rows[dimension])
+                data[f'd{i}'] = codes.astype(np.int64)
+            for i, measure in enumerate(measures):
+                data[f'm{i}'] = rows[measure].to_numpy(np.float64)
+            for i, column in enumerate(first):
+                codes, decoders[column] = encode_column(rows[column])
+                data[f'f{i}'] = codes.astype(np.int64)
+            data['row'] = np.arange(len(rows), dtype=np.int64)
+
+            # Sorted by the dimension codes, i.e. in groupby order
+            result = self._aggregate(data, [f'd{i}' for i in range(len(dimensions))], len(measures), len(first))
+            cells = pd.DataFrame({dimension: decode_key(result[f'd{i}'], decoders[dimension])
+                                  for i, dimension in enumerate(dimensions)})
+            cells['rows'] = result['rows'].astype(np.int64)
+            cells['first_row'] = result['first_row'].astype(np.int64)
+            for i, measure in enumerate(measures):
+                cells[f'{measure}__sum'] = result[f's{i}'].astype(np.float64)
+                cells[f'{measure}__count'] = result[f'n{i}'].astype(np.int64)
+                cells[f'{measure}__sumsq'] = result[f'q{i}'].astype(np.float64)
+            for i, column in enumerate(first):
+                cells[f'{column}__first'] = decode_column(result[f'f{i}'].astype(np.int64), decoders[column])
+            s.rows_out = len(cells)
+        return SalesCube(cells, dimensions, measures, first, len(rows))
+
+    def orders_by_region(self, rows):
+        with span(f'{self.name} distinct orders by region', 'groupby', rows_in=len(rows)) as s:
+            codes, labels = encode_column(rows['Region'])
+            data = pd.DataFrame({'g': codes.astype(np.int64), 'o': rows['OrderNumber'].to_numpy()})
+            groups, counts = self._distinct_counts(data)
+            index = pd.Index(decode_column(groups.astype(np.int64), labels), name='Region')
+            orders = pd.Series(counts.astype(np.int64), index=index, name='OrderNumber')
+            s.rows_out = len(orders)
+        return orders
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class DuckDBBackend(EngineBackend):
+    name = 'duckdb'
+
+    def __init__(self):
+        try:
+            import duckdb
+            import pyarrow
+        except ImportError:
+            raise ImportError("The duckdb backend needs the 'duckdb' and 'pyarrow' packages")
+        self.pa = pyarrow
+        self.con = duckdb.connect()
+
+    def _query(self, sql, inputs, arrays=False):
+        # Frames go in and come out as Arrow tables, which share the string
+        # buffers of pandas' str columns (scanning the frames directly
+        # converts every string); the result is fetched before the inputs
+        # are unregistered, as it is streamed from them
+        for name, frame in inputs.items():
+            self.con.register(name, self.pa.Table.from_pandas(frame, preserve_index=False))
+        try:
+            result = self.con.execute(sql).to_arrow_table()
+            if arrays:
+                return {name: column.to_numpy() for name, column in zip(result.column_names, result.columns)}
+            return result.to_pandas()
+        finally:
+            for name in inputs:
+                self.con.unregister(name)
+
+    def _join(self, frames, plan, owners):
+        sales = frames[FACT_TABLE]
+        inputs = {'sales': sales.assign(__row=np.arange(len(sales)))}
+        aliases = {FACT_TABLE: 's'}
+        sql = 'FROM sales AS s'
+        for i, (table, foreign_key, dimension, key, keep) in enumerate(plan):
+            alias = aliases[dimension] = f'j{i}'
+            inputs[f'{alias}_input'] = frames[dimension][[key] + keep]
+            sql += (f' LEFT JOIN {alias}_input AS {alias}'
+                    f' ON {aliases[table]}.{_quote(foreign_key)} = {alias}.{_quote(key)}')
+        columns = [f's.{_quote(c)}' for c in sales.columns]
+        columns += [f'{aliases[dimension]}.{_quote(source)} AS {_quote(attribute)}'
+                    for attribute, (dimension, source) in owners.items()]
+        return self._query(f"SELECT {', '.join(columns)} {sql} ORDER BY s.__row", inputs)
+
+    def _aggregate(self, data, keys, measures, first):
+        columns = keys + ['count(*) AS rows', 'min(row) AS first_row']
+        for i in range(measures):
+            columns += [f'coalesce(fsum(m{i}), 0) AS s{i}', f'count(m{i}) AS n{i}',
+                        f'coalesce(fsum(m{i} * m{i}), 0) AS q{i}']
+        for i in range(first):
+            # The value of the group's earliest row that has one, like 'first'
+            columns.append(f'coalesce(arg_min(f{i}, row) FILTER (WHERE f{i} >= 0), -1) AS f{i}')
+        sql = (f"SELECT {', '.join(columns)} FROM cube_input "
+               f"GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}")
+        return self._query(sql, {'cube_input': pd.DataFrame(data)}, arrays=True)
+
+    def _distinct_counts(self, data):
+        result = self._query('SELECT g, count(DISTINCT o) AS n FROM orders_input WHERE g >= 0 '
+                             'GROUP BY g ORDER BY g', {'orders_input': data}, arrays=True)
+        return result['g'], result['n']
+
+
+class PolarsBackend(EngineBackend):
+    name = 'polars'
+
+    def __init__(self):
+        try:
+            import polars
+            import pyarrow  # noqa: F401  (polars converts pandas frames through Arrow)
+        except ImportError:
+            raise ImportError("The polars backend needs the 'polars' and 'pyarrow' packages")
+        self.pl = polars
+
+    def _join(self, frames, plan, owners):
+        pl = self.pl
+        sales = frames[FACT_TABLE]
+        query = pl.from_pandas(sales).lazy().with_row_index('__row')
+        names = {FACT_TABLE: {c: c for c in sales.columns}}
+        for i, (table, foreign_key, dimension, key, keep) in enumerate(plan):
+            # Dimension columns get unique names, so no column of the sales
+            # rows or of another dimension is shadowed
+            names[dimension] = {c: f'__j{i}_{c}' for c in [key] + keep}
+            right = pl.from_pandas(frames[dimension][[key] + keep]).lazy().rename(names[dimension])
+            query = query.join(right, left_on=names[table][foreign_key], right_on=names[dimension][key],
+                               how='left')
+        columns = [pl.col(c) for c in sales.columns]
+        columns += [pl.col(names[dimension][source]).alias(attribute)
+                    for attribute, (dimension, source) in owners.items()]
+        return query.sort('__row').select(columns).collect().to_pandas()
+
+    def _aggregate(self, data, keys, measures, first):
+        pl = self.pl
+        columns = [pl.len().alias('rows'), pl.col('row').min().alias('first_row')]
+        for i in range(measures):
+            m = pl.col(f'm{i}')
+            columns += [m.sum().alias(f's{i}'), m.count().alias(f'n{i}'), (m * m).sum().alias(f'q{i}')]
+        for i in range(first):
+            # Rows keep their order within a group, so this is the earliest
+            f = pl.col(f'f{i}')
+            columns.append(f.filter(f >= 0).first().fill_null(-1).alias(f'f{i}'))
+        result = (pl.DataFrame(data, nan_to_null=True).lazy()
+                  .group_by(keys).agg(columns).sort(keys).collect())
+        return {name: result[name].to_numpy() for name in result.columns}
+
+    def _distinct_counts(self, data):
+        pl = self.pl
+        result = (pl.from_pandas(data).lazy().filter(pl.col('g') >= 0)
+                  .group_by('g').agg(pl.col('o').drop_nulls().n_unique().alias('n'))
+                  .sort('g').collect())
+        return result['g'].to_numpy(), result['n'].to_numpy()
+
+
+def get_backend(name, workers=1, partition_by='Product Name'):
+    # `workers` and `partition_by` apply to the pandas cube build; DuckDB and
+    # Polars run on their own thread pools, one thread per core
+    if name == 'pandas':
+        return PandasBackend(workers, partition_by)
+    if name == 'duckdb':
+        return DuckDBBackend()
+    if name == 'polars':
+        return PolarsBackend()
+    raise ValueError(f"Unknown backend '{name}', expected one of {BACKENDS}")
+
+
+def run_backend(backend, frames):
+    # (joined rows, cube, Steps 3-12 tables, {stage: seconds}) as eda.py
+    # computes them, on one backend
+    seconds = {}
+    start = time.perf_counter()
+    rows = backend.join(frames)
+    seconds['join'] = time.perf_counter() - start
+    rows, _ = compact.compact_fact_table(star_schema.add_derived_columns(rows.copy()))
+    start = time.perf_counter()
+    cube = backend.cube(rows)
+    seconds['cube'] = time.perf_counter() - start
+    start = time.perf_counter()
+    orders = backend.orders_by_region(rows)
+    seconds['orders'] = time.perf_counter() - start
+    return rows, cube, metrics.all_tables(cube, orders), seconds
+
+
+def _difference(left, right, exact):
+    try:
+        if isinstance(left, pd.Series):
+            pd.testing.assert_series_equal(left, right, check_exact=exact, rtol=PARITY_RTOL)
+        else:
+            pd.testing.assert_frame_equal(left, right, check_exact=exact, rtol=PARITY_RTOL)
+    except AssertionError as e:
+        return str(e).strip().splitlines()[0]
+    return None
+
+
+def compare_runs(expected, result):
+    # [(table, difference)] between two run_backend() results; the joined rows
+    # must match exactly, sums up to PARITY_RTOL
+    rows, cube, tables, _ = expected
+    other_rows, other_cube, other_tables, _ = result
+    differences = []
+    difference = _difference(rows, other_rows, exact=True)
+    if difference:
+        differences.append(('joined rows', difference))
+    difference = _difference(cube.cells, other_cube.cells, exact=False)
+    if difference:
+        differences.append(('cube cells', difference))
+    for name, table in tables.items():
+        difference = _difference(table, other_tables[name], exact=False)
+        if difference:
+            differences.append((name, difference))
+    return differences
+
+
+def parity(frames, backends):
+    # {backend name: [(table, difference)]} against the first backend
+    runs = [run_backend(backend, frames) for backend in backends]
+    return {backend.name: compare_runs(runs[0], run) for backend, run in zip(backends[1:], runs[1:])}
+
+
+def main():
+    from synthetic import SyntheticSales
+
+    parser = argparse.ArgumentParser(description='Compare the pandas, DuckDB and Polars backends on synthetic sales.')
+    parser.add_argument('--lines', type=int, default=1_000_000)
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=available_backends())
+    parser.add_argument('--workers', type=int, default=1, help='pandas cube processes (0: one per CPU)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    frames = SyntheticSales(args.seed).frames(args.lines)
+    backends = [get_backend(name, args.workers or None) for name in args.backends]
+    print(f"{args.lines} sales lines, {os.cpu_count()} CPUs, best of {args.repeat}:")
+    print(f"  {'backend':8s} {'join':>8s} {'cube':>8s} {'orders':>8s}  parity with {backends[0].name}")
+    reference = None
+    for backend in backends:
+        runs = [run_backend(backend, frames) for _ in range(args.repeat)]
+        seconds = {stage: min(run[3][stage] for run in runs) for stage in runs[0][3]}
+        differences = []
+        if reference is None:
+            reference = runs[0]
+            status = '-'
+        else:
+            differences = compare_runs(reference, runs[0])
+            status = 'identical' if not differences else f'{len(differences)} tables differ'
+        print(f"  {backend.name:8s} {seconds['join']:8.3f} {seconds['cube']:8.3f} {seconds['orders']:8.3f}  {status}")
+        for name, difference in differences:
+            print(f"    {name}: {difference}")
+
+
+if __name__ == '__main__':
+    main()
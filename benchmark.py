@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from pipeline import TASKS
+from synthetic import SyntheticSales
+
+DEFAULT_SCALES = [10_000, 100_000, 1_000_000]
+RESULTS_FILE = 'benchmark_results.json'
+
+# Times every task of the pipeline graph after 'load' (join, enrich, cube,
+# orders and the per-step metrics) on synthetic data at each scale. Each
+# task runs `repeat` times on the same inputs and the best time is kept; one
+# more run under tracemalloc gives its peak allocation above what was live
+# before it started. Results are written as JSON so two runs can be compared
+# with --compare.
+
+
+def _run_task(name, outputs):
+    t = TASKS[name]
+    return t.fn(*[outputs[dep] for dep in t.deps])
+
+
+def _rows(value):
+    # Rows (or cube cells) a task produced; None for dicts of result tables
+    if isinstance(value, dict):
+        value = value.get('rows')
+    return len(value) if hasattr(value, '__len__') else None
+
+
+def benchmark_scale(lines, repeat=3, seed=0):
+    start = time.perf_counter()
+    frames = SyntheticSales(seed).frames(lines)
+    generate_seconds = time.perf_counter() - start
+
+    outputs = {'load': frames}
+    results = []
+    for name in TASKS:
+        if name == 'load':
+            continue
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            value = _run_task(name, outputs)
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        _run_task(name, outputs)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        outputs[name] = value
+        results.append({
+            'lines': lines,
+            'task': name,
+            'seconds': min(timings),
+            'mean_seconds': float(np.mean(timings)),
+            'peak_mb': peak / 2**20,
+            'rows_out': _rows(value),
+        })
+    fact_mb = frames['Sales Orders'].memory_usage(deep=True, index=False).sum() / 2**20
+    return {'lines': lines, 'generate_seconds': generate_seconds, 'sales_orders_mb': fact_mb}, results
+
+
+def compare(results, baseline, threshold):
+    # (lines, task, old seconds, new seconds, ratio) for every task measured
+    # in both runs, flagged when the new time exceeds old * threshold
+    old = {(r['lines'], r['task']): r['seconds'] for r in baseline['results']}
+    rows = []
+    for r in results:
+        key = (r['lines'], r['task'])
+        if key in old:
+            ratio = r['seconds'] / old[key] if old[key] else float('inf')
+            rows.append({'lines': r['lines'], 'task': r['task'], 'old_seconds': old[key],
+                         'new_seconds': r['seconds'], 'ratio': ratio, 'regression': ratio > threshold})
+    return pd.DataFrame(rows)
+
+
+def parse_scales(text):
+    return [int(float(scale)) for scale in text.split(',') if scale.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and memory-profile every analysis step on synthetic data.')
+    parser.add_argument('--scales', default=','.join(str(s) for s in DEFAULT_SCALES),
+                        help='comma-separated numbers of order lines, e.g. 1e4,1e6,5e7')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=RESULTS_FILE)
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2, help='slowdown ratio reported as a regression')
+    args = parser.parse_args()
+
+    scales, results = [], []
+    for lines in parse_scales(args.scales):
+        scale, scale_results = benchmark_scale(lines, args.repeat, args.seed)
+        scales.append(scale)
+        results.extend(scale_results)
+        print(f"\n{lines} lines ({scale['sales_orders_mb']:.1f} MB of Sales Orders, "
+              f"generated in {scale['generate_seconds']:.1f}s):")
+        table = pd.DataFrame(scale_results)[['task', 'seconds', 'peak_mb', 'rows_out']].astype({'rows_out': 'Int64'})
+        print(table.round(4).to_string(index=False))
+
+    report = {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'scales': scales,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        comparison = compare(results, baseline, args.threshold)
+        print(f"\nCompared with {args.compare}:")
+        print(comparison.round(4).to_string(index=False))
+        regressions = comparison[comparison['regression']] if len(comparison) else comparison
+        if len(regressions):
+            print(f"\n⚠️  {len(regressions)} task(s) slower than {args.threshold}x the baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrument import span
+
+# Bootstrap confidence intervals for the per-sale metrics of Steps 7, 8 and
+# 12, per Region, Channel and Product:
+#
+#   Profit_per_Sale   mean Profit per sales line
+#   Margin_%          total Profit / total Line Total * 100
+#   Avg_Order_Value   mean Line Total per sales line (as in Step 12)
+#
+# Every statistic follows from the sums of Profit and Line Total over a
+# resample. Groups are resampled exactly: each resample is one batch of
+# random row indices within the group, counted per row and multiplied with
+# both columns. Resamples are drawn many at a time, in chunks of at most
+# CHUNK_ELEMENTS indices to bound memory; chunks can run in a process pool.
+# Each (dimension, group, chunk) has its own seed derived from `seed`, so
+# the intervals do not depend on the number of workers.
+#
+# With normal_rows set, groups of more rows take a shortcut instead: by the
+# central limit theorem their resample sums are close to normal with mean
+# n * mean and covariance n * covariance of the rows, so they are drawn from
+# that distribution, computed from the group's sufficient statistics in one
+# pass, and the cost no longer grows with resamples x rows. The error is of
+# order 1 / sqrt(n) and largest for skewed rows, so it is off by default;
+# the Method column of every table says which groups were resampled
+# ('exact') and which were drawn from the normal limit ('normal').
+#
+# The resample statistics are kept, so the chance that one group really
+# beats another (e.g. the best region in Step 7 over the runner-up) is the
+# share of resamples in which it does.
+
+BOOTSTRAP_DIMENSIONS = ['Region', 'Channel', 'Product Name']
+STATISTICS = ['Profit_per_Sale', 'Margin_%', 'Avg_Order_Value']
+RESAMPLES = 1000
+CONFIDENCE = 0.95
+CHUNK_ELEMENTS = 1 << 22
+
+
+def _pool_context():
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+_values = None
+
+
+def _init_worker(values):
+    global _values
+    _values = values
+
+
+def resample_sums(start, stop, resamples, seed_key, seed):
+    # (resamples, 2) sums of Profit and Line Total over resamples of the rows
+    # _values[start:stop], drawn in blocks of at most CHUNK_ELEMENTS indices.
+    # The draws are turned into how often each row was picked (one bincount
+    # over all resamples of the block) and multiplied with the values, which
+    # is several times faster than gathering the drawn rows.
+    values = _values[start:stop]
+    n = len(values)
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=seed_key))
+    sums = np.zeros((resamples, 2))
+    block = max(1, min(n, CHUNK_ELEMENTS))
+    for offset in range(0, n, block):
+        size = min(block, n - offset)
+        index = rng.integers(0, n, size=(resamples, size))
+        index += (np.arange(resamples) * n)[:, np.newaxis]
+        counts = np.bincount(index.ravel(), minlength=resamples * n).reshape(resamples, n)
+        sums += counts @ values
+    return sums
+
+
+def normal_sums(values, resamples, seed_key, seed):
+    # (resamples, 2) sums of Profit and Line Total drawn from the normal limit
+    # of resampling the rows `values`
+    n = len(values)
+    totals = values.sum(axis=0)
+    products = values.T @ values
+    covariance = products - np.outer(totals, totals) / n
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=seed_key))
+    return rng.multivariate_normal(totals, covariance, size=resamples, method='eigh')
+
+
+def _statistics(sums, n):
+    profit, revenue = sums[..., 0], sums[..., 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.stack([profit / n, profit / revenue * 100, revenue / n], axis=-1)
+
+
+class BootstrapResult:
+    # Estimates, intervals and resample statistics of one dimension
+
+    def __init__(self, dimension, groups, sizes, estimates, samples, confidence, methods):
+        self.dimension = dimension
+        self.groups = groups          # group labels
+        self.sizes = sizes            # rows per group
+        self.estimates = estimates    # groups x STATISTICS, on all rows
+        self.samples = samples        # groups x resamples x STATISTICS
+        self.confidence = confidence
+        self.methods = methods        # 'exact' or 'normal' per group
+
+    def table(self):
+        alpha = (1 - self.confidence) / 2
+        low, high = np.nanquantile(self.samples, [alpha, 1 - alpha], axis=1)
+        table = pd.DataFrame({self.dimension: self.groups, 'Sales': self.sizes})
+        for i, statistic in enumerate(STATISTICS):
+            table[statistic] = self.estimates[:, i]
+            table[f'{statistic}_low'] = low[:, i]
+            table[f'{statistic}_high'] = high[:, i]
+        table['Method'] = self.methods
+        return table
+
+    def leader(self, statistic='Profit_per_Sale'):
+        # (best group, runner-up, share of resamples where the best is ahead)
+        i = STATISTICS.index(statistic)
+        order = np.argsort(-self.estimates[:, i], kind='stable')
+        if len(order) < 2:
+            return (self.groups[order[0]] if len(order) else None), None, None
+        best, second = order[0], order[1]
+        ahead = float(np.mean(self.samples[best, :, i] > self.samples[second, :, i]))
+        return self.groups[best], self.groups[second], ahead
+
+
+def bootstrap(rows, dimensions=BOOTSTRAP_DIMENSIONS, resamples=RESAMPLES, confidence=CONFIDENCE,
+              seed=0, workers=1, normal_rows=None):
+    # {dimension: BootstrapResult}; rows with a missing Profit, Line Total or
+    # group are left out. Groups of more than normal_rows rows are drawn from
+    # the normal limit (None: every group is resampled exactly).
+    values = np.column_stack([rows['Profit'].to_numpy(np.float64), rows['Line Total'].to_numpy(np.float64)])
+    valid = ~np.isnan(values).any(axis=1)
+
+    # Rows of every dimension sorted by group, so each group is a contiguous
+    # slice of one array that the workers inherit
+    layouts = []
+    parts = []
+    offset = 0
+    for dimension in dimensions:
+        column = rows[dimension].astype('category')
+        codes = column.cat.codes.to_numpy()
+        keep = valid & (codes >= 0)
+        order = np.flatnonzero(keep)[np.argsort(codes[keep], kind='stable')]
+        sizes = np.bincount(codes[keep], minlength=len(column.cat.categories))
+        present = np.flatnonzero(sizes)
+        bounds = offset + np.concatenate([[0], np.cumsum(sizes[present])])
+        layouts.append((dimension, column.cat.categories[present], sizes[present], bounds))
+        parts.append(values[order])
+        offset += len(order)
+    stacked = np.concatenate(parts) if parts else np.empty((0, 2))
+
+    tasks = []
+    normal = []
+    for d, (dimension, groups, sizes, bounds) in enumerate(layouts):
+        for g in range(len(groups)):
+            if normal_rows is not None and sizes[g] > normal_rows:
+                normal.append((d, g, int(bounds[g]), int(bounds[g + 1])))
+                continue
+            per_chunk = max(1, CHUNK_ELEMENTS // max(int(sizes[g]), 1))
+            for c, first in enumerate(range(0, resamples, per_chunk)):
+                tasks.append((d, g, int(bounds[g]), int(bounds[g + 1]), min(per_chunk, resamples - first), c))
+
+    with span('bootstrap', 'resample', rows_in=len(rows)) as s:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers <= 1 or len(tasks) <= 1:
+            _init_worker(stacked)
+            sums = [resample_sums(start, stop, count, (d, g, c), seed) for d, g, start, stop, count, c in tasks]
+            _init_worker(None)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context(),
+                                     initializer=_init_worker, initargs=(stacked,)) as pool:
+                futures = [pool.submit(resample_sums, start, stop, count, (d, g, c), seed)
+                           for d, g, start, stop, count, c in tasks]
+                sums = [future.result() for future in futures]
+        collected = {}
+        for (d, g, *_), chunk in zip(tasks, sums):
+            collected.setdefault((d, g), []).append(chunk)
+        for d, g, start, stop in normal:
+            collected[(d, g)] = [normal_sums(stacked[start:stop], resamples, (d, g), seed)]
+        s.rows_out = len(collected)
+
+    results = {}
+    for d, (dimension, groups, sizes, bounds) in enumerate(layouts):
+        totals = np.array([stacked[bounds[g]:bounds[g + 1]].sum(axis=0) for g in range(len(groups))]).reshape(-1, 2)
+        samples = np.array([np.concatenate(collected[(d, g)]) for g in range(len(groups))]).reshape(len(groups), resamples, 2)
+        n = sizes.astype(np.float64)
+        methods = ['normal' if normal_rows is not None and size > normal_rows else 'exact' for size in sizes]
+        results[dimension] = BootstrapResult(dimension, list(groups), sizes, _statistics(totals, n),
+                                             _statistics(samples, n[:, np.newaxis]), confidence, methods)
+    return results
+
+
+def bootstrap_tables(rows, resamples=RESAMPLES, confidence=CONFIDENCE, seed=0, workers=1, normal_rows=None):
+    results = bootstrap(rows, BOOTSTRAP_DIMENSIONS, resamples, confidence, seed, workers, normal_rows)
+    # Best group by Profit_per_Sale of every dimension, and the share of
+    # resamples in which it beats the runner-up
+    leaders = [(dimension, *results[dimension].leader('Profit_per_Sale')) for dimension in BOOTSTRAP_DIMENSIONS]
+    return {
+        'bootstrap_region': results['Region'].table(),
+        'bootstrap_channel': results['Channel'].table(),
+        'bootstrap_product': results['Product Name'].table(),
+        'bootstrap_leaders': pd.DataFrame(leaders, columns=['Dimension', 'Leader', 'Runner_Up', 'Share_Ahead']),
+    }, results
+
+
+def main():
+    from synthetic import SyntheticSales
+    import compact
+    import star_schema
+
+    parser = argparse.ArgumentParser(description='Time bootstrap intervals on synthetic sales rows.')
+    parser.add_argument('--lines', type=int, default=2_000_000)
+    parser.add_argument('--resamples', type=int, default=RESAMPLES)
+    parser.add_argument('--workers', type=int, default=0, help='processes (0: one per CPU)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--normal-rows', type=int,
+                        help='draw groups of more rows from the normal limit instead of resampling them')
+    args = parser.parse_args()
+
+    frames = SyntheticSales(args.seed).frames(args.lines)
+    schema = star_schema.build_sales_schema(frames)
+    rows = schema.frame(frames['Sales Orders'].columns.tolist() + star_schema.SALES_ATTRIBUTES)
+    rows, _ = compact.compact_fact_table(star_schema.add_derived_columns(rows))
+
+    start = time.perf_counter()
+    tables, results = bootstrap_tables(rows, args.resamples, seed=args.seed, workers=args.workers or None,
+                                       normal_rows=args.normal_rows)
+    seconds = time.perf_counter() - start
+    print(f"{len(rows)} sales rows, {args.resamples} resamples per group, "
+          f"{sum(len(r.groups) for r in results.values())} groups: {seconds:.1f}s")
+    print(tables['bootstrap_region'].round(2).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
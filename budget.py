@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+from loader import BUDGET_SHEET
+
+# Budget vs actual by product and month for every 'YYYY Budgets' sheet.
+# Annual budgets are spread over the twelve months (evenly, or following the
+# product's sales pattern of the year before), aligned with the actual
+# Line Total of each product and month in one join, and compared for all
+# products at once: variance, attainment % and the cumulative year-to-date
+# gap. Months without sales count as zero actual.
+
+KEYS = ['Product Name', 'Year', 'Month']
+PHASINGS = ['even', 'seasonal']
+
+
+def annual_budgets(frames):
+    # Product Name, Year, Budget from every budget sheet among the frames
+    parts = []
+    for name, frame in frames.items():
+        match = BUDGET_SHEET.match(name)
+        if not match:
+            continue
+        year = int(match.group(1))
+        column = name if name in frame.columns else frame.columns[1]
+        parts.append(pd.DataFrame({
+            'Product Name': frame['Product Name'].astype(str),
+            'Year': year,
+            'Budget': frame[column].astype(np.float64),
+        }))
+    if not parts:
+        return pd.DataFrame({'Product Name': pd.Series(dtype=str), 'Year': pd.Series(dtype=np.int64),
+                             'Budget': pd.Series(dtype=np.float64)})
+    return pd.concat(parts, ignore_index=True)
+
+
+def monthly_actuals(cube, measure='Line Total'):
+    actuals = cube.sum(KEYS, measure).rename('Actual').reset_index()
+    actuals['Product Name'] = actuals['Product Name'].astype(str)
+    actuals['Year'] = actuals['Year'].astype(np.int64)
+    actuals['Month'] = actuals['Month'].astype(np.int64)
+    return actuals
+
+
+def monthly_budgets(annual, actuals, phasing='even'):
+    # Spread each annual budget over its months. 'seasonal' follows the
+    # product's share of sales per month in the year before the budget
+    # year; products without sales that year are spread evenly.
+    if phasing not in PHASINGS:
+        raise ValueError(f"phasing must be one of {PHASINGS}, got '{phasing}'")
+    grid = annual.loc[annual.index.repeat(12)].reset_index(drop=True)
+    grid['Month'] = np.tile(np.arange(1, 13), len(annual))
+    share = np.full(len(grid), 1 / 12)
+    if phasing == 'seasonal' and len(actuals):
+        prior = actuals.assign(Year=actuals['Year'] + 1)
+        yearly = prior.groupby(['Product Name', 'Year'])['Actual'].transform('sum')
+        prior = prior.assign(Share=prior['Actual'] / yearly.where(yearly != 0))
+        has_prior = grid.merge(prior.groupby(['Product Name', 'Year'], as_index=False)['Actual'].sum(),
+                               on=['Product Name', 'Year'], how='left')['Actual'].gt(0).to_numpy()
+        prior_share = grid.merge(prior[KEYS + ['Share']], on=KEYS, how='left')['Share'].to_numpy()
+        share = np.where(has_prior, np.nan_to_num(prior_share), share)
+    grid['Budget'] = grid['Budget'].to_numpy() * share
+    return grid
+
+
+def _attainment(table):
+    budget = table['Budget'].where(table['Budget'] != 0)
+    table['Variance'] = table['Actual'] - table['Budget']
+    table['Attainment_%'] = table['Actual'] / budget * 100
+    return table
+
+
+def _year_to_date(table, by):
+    # Running totals within each year, in month order
+    running = table.groupby(by, sort=False)[['Budget', 'Actual']].cumsum()
+    table['YTD_Budget'] = running['Budget']
+    table['YTD_Actual'] = running['Actual']
+    table['YTD_Gap'] = table['YTD_Actual'] - table['YTD_Budget']
+    table['YTD_Attainment_%'] = table['YTD_Actual'] / table['YTD_Budget'].where(table['YTD_Budget'] != 0) * 100
+    return table
+
+
+def budget_vs_actual(cube, frames, phasing='even'):
+    # One row per budgeted product and month
+    actuals = monthly_actuals(cube)
+    report = monthly_budgets(annual_budgets(frames), actuals, phasing)
+    report = report.merge(actuals, on=KEYS, how='left')
+    report['Actual'] = report['Actual'].fillna(0.0)
+    report = _attainment(report.sort_values(KEYS, ignore_index=True))
+    return _year_to_date(report, ['Product Name', 'Year'])
+
+
+def budget_tables(cube, frames, phasing='even'):
+    report = budget_vs_actual(cube, frames, phasing)
+    by_product = _attainment(report.groupby(['Year', 'Product Name'], as_index=False)[['Budget', 'Actual']].sum())
+    by_month = _attainment(report.groupby(['Year', 'Month'], as_index=False)[['Budget', 'Actual']].sum())
+    return {
+        'budget_vs_actual': report,
+        'budget_by_product': by_product,
+        'budget_by_month': _year_to_date(by_month, ['Year']),
+    }
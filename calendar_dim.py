@@ -0,0 +1,77 @@
+import calendar
+
+import numpy as np
+import pandas as pd
+
+from instrument import span
+
+# The order calendar as a dimension. Order dates repeat on many sales rows
+# (a few years of days against millions of lines), so Year, Month, Quarter
+# and Month_Name are computed once per distinct date and fetched onto the
+# rows by an integer date key, instead of with a .dt accessor per row.
+# Month_Name is an ordered categorical (January ... December), so it sorts
+# in calendar order and costs one small integer code per row.
+
+DATE_KEY = 'Date Key'   # days since 1970-01-01
+MISSING_KEY = np.iinfo(np.int64).min   # the key of NaT
+CALENDAR_ATTRIBUTES = ['Year', 'Month', 'Quarter', 'Month_Name']
+MONTH_NAMES = list(calendar.month_name)[1:]
+
+
+def month_name(months):
+    # Ordered Month_Name categorical for month numbers 1-12 (missing stays missing)
+    months = np.asarray(months, dtype=np.float64)
+    codes = np.where(np.isnan(months), -1, months - 1).astype(np.int64)
+    return pd.Categorical.from_codes(codes, categories=MONTH_NAMES, ordered=True)
+
+
+def parse_dates(values):
+    # datetime64 values as they are, anything else through pd.to_datetime
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return pd.to_datetime(values)
+
+
+def date_keys(dates):
+    # Integer day number of every date; missing dates get MISSING_KEY
+    return np.asarray(parse_dates(dates)).astype('datetime64[D]').astype(np.int64)
+
+
+def calendar_table(days):
+    # One row per date key: Date Key, Year, Month, Quarter, Month_Name
+    index = pd.DatetimeIndex(np.asarray(days, dtype=np.int64).astype('datetime64[D]'))
+    months = index.month.to_numpy(np.int32)
+    return pd.DataFrame({
+        DATE_KEY: np.asarray(days, dtype=np.int64),
+        'Year': index.year.to_numpy(np.int32),
+        'Month': months,
+        'Quarter': ((months - 1) // 3 + 1).astype(np.int32),
+        'Month_Name': month_name(months),
+    })
+
+
+def calendar_dimension(dates):
+    # (calendar table of the distinct dates, row position of every date in
+    # it; -1 for missing dates). factorize hashes the integer keys once, so
+    # the positions come out of the same pass that finds the distinct dates.
+    keys = date_keys(dates)
+    positions, days = pd.factorize(keys)
+    valid = days != MISSING_KEY
+    if not valid.all():
+        # Missing dates were factorized like any other key; send them to -1
+        remap = np.full(len(days), -1, dtype=np.intp)
+        remap[valid] = np.arange(valid.sum())
+        positions = remap[positions]
+        days = days[valid]
+    return calendar_table(days), positions
+
+
+def add_calendar_columns(sales, date_column='OrderDate'):
+    # Year, Month, Quarter and Month_Name for every row, added in place
+    with span('calendar dimension', 'transform', rows_in=len(sales)) as s:
+        table, positions = calendar_dimension(sales[date_column])
+        s.rows_out = len(table)
+        for attribute in CALENDAR_ATTRIBUTES:
+            values = table[attribute].array.take(positions, allow_fill=True)
+            sales[attribute] = pd.Series(values, index=sales.index, name=attribute)
+    return sales
@@ -0,0 +1,433 @@
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+matplotlib.use('Agg')  # headless: charts are only ever written to files
+
+import matplotlib.pyplot as plt  # noqa: E402
+import pandas as pd  # noqa: E402
+import seaborn as sns  # noqa: E402
+
+from instrument import TRACER, span  # noqa: E402
+
+CHART_MANIFEST = '.chart_hashes.json'
+
+# One drawing function per chart file. Each takes the tables the chart shows
+# as keyword arguments and draws onto the current pyplot figure; saving,
+# hashing and scheduling are handled by render_charts().
+
+
+def draw_regional_sales(sales_by_geographic_region):
+    plt.figure(figsize=(10, 6))
+    sns.barplot(x=sales_by_geographic_region.index, y=sales_by_geographic_region.values, palette='viridis')
+    plt.title('Total Sales by Geographic Region', fontsize=16, fontweight='bold')
+    plt.xlabel('Geographic Region', fontsize=12)
+    plt.ylabel('Total Sales ($)', fontsize=12)
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+
+
+def draw_household_metrics(region_metrics):
+    plt.figure(figsize=(12, 5))
+
+    plt.subplot(1, 2, 1)
+    sns.barplot(data=region_metrics, x='Region', y='Revenue_per_Household', palette='viridis')
+    plt.title('Revenue per Household by Region', fontweight='bold')
+    plt.ylabel('Revenue per Household ($)')
+    plt.xticks(rotation=45)
+
+    plt.subplot(1, 2, 2)
+    sns.barplot(data=region_metrics, x='Region', y='Profit_per_Household', palette='viridis')
+    plt.title('Profit per Household by Region', fontweight='bold')
+    plt.ylabel('Profit per Household ($)')
+    plt.xticks(rotation=45)
+
+    plt.tight_layout()
+
+
+def draw_profit_per_sale(profit_per_sale):
+    plt.figure(figsize=(15, 5))
+
+    plt.subplot(1, 3, 1)
+    sns.barplot(data=profit_per_sale, x='Region', y='Profit', palette='viridis')
+    plt.title('Average Profit per Sale by Region', fontweight='bold')
+    plt.ylabel('Average Profit per Sale ($)')
+    plt.xticks(rotation=45)
+
+    plt.subplot(1, 3, 2)
+    sns.barplot(data=profit_per_sale, x='Region', y='Line Total', palette='viridis')
+    plt.title('Average Revenue per Sale by Region', fontweight='bold')
+    plt.ylabel('Average Revenue per Sale ($)')
+    plt.xticks(rotation=45)
+
+    plt.subplot(1, 3, 3)
+    sns.barplot(data=profit_per_sale, x='Region', y='Profit_Margin_Percent', palette='viridis')
+    plt.title('Profit Margin % by Region', fontweight='bold')
+    plt.ylabel('Profit Margin (%)')
+    plt.xticks(rotation=45)
+
+    plt.tight_layout()
+
+
+def draw_channel_analysis(channel_by_region, channel_percentages, profit_by_channel):
+    plt.figure(figsize=(15, 10))
+
+    # Chart 1: Total sales by channel and region
+    plt.subplot(2, 2, 1)
+    channel_by_region.plot(kind='bar', ax=plt.gca(), color=['#1f77b4', '#ff7f0e', '#2ca02c'])
+    plt.title('Total Sales by Region and Channel', fontweight='bold')
+    plt.ylabel('Total Sales ($)')
+    plt.xlabel('Region')
+    plt.legend(title='Channel')
+    plt.xticks(rotation=45)
+
+    # Chart 2: Channel distribution percentages
+    plt.subplot(2, 2, 2)
+    channel_percentages.plot(kind='bar', ax=plt.gca(), color=['#1f77b4', '#ff7f0e', '#2ca02c'])
+    plt.title('Channel Distribution by Region (%)', fontweight='bold')
+    plt.ylabel('Percentage (%)')
+    plt.xlabel('Region')
+    plt.legend(title='Channel')
+    plt.xticks(rotation=45)
+
+    # Chart 3: Average profit by channel
+    plt.subplot(2, 2, 3)
+    sns.barplot(x=profit_by_channel.index, y=profit_by_channel.values, palette='viridis')
+    plt.title('Average Profit per Sale by Channel', fontweight='bold')
+    plt.ylabel('Average Profit per Sale ($)')
+    plt.xticks(rotation=45)
+
+    # Chart 4: Channel performance by region (heatmap)
+    plt.subplot(2, 2, 4)
+    sns.heatmap(channel_by_region, annot=True, fmt='.0f', cmap='YlOrRd')
+    plt.title('Sales Heatmap: Region vs Channel', fontweight='bold')
+    plt.xlabel('Channel')
+    plt.ylabel('Region')
+
+    plt.tight_layout()
+
+
+def draw_product_analysis(top_products, top_products_profit, top_margin_products, product_region_sales,
+                          product_frequency, avg_sale_by_product):
+    plt.figure(figsize=(20, 15))
+
+    # Chart 1: Top 10 products by sales
+    plt.subplot(2, 3, 1)
+    top_products.plot(kind='bar', color='skyblue')
+    plt.title('Top 10 Products by Total Sales', fontweight='bold')
+    plt.ylabel('Total Sales ($)')
+    plt.xticks(rotation=45, ha='right')
+
+    # Chart 2: Top 10 products by profit
+    plt.subplot(2, 3, 2)
+    top_products_profit.plot(kind='bar', color='lightcoral')
+    plt.title('Top 10 Products by Total Profit', fontweight='bold')
+    plt.ylabel('Total Profit ($)')
+    plt.xticks(rotation=45, ha='right')
+
+    # Chart 3: Average profit margin by product
+    plt.subplot(2, 3, 3)
+    sns.barplot(data=top_margin_products, x='Profit_Margin_Percent', y='Product Name', palette='viridis')
+    plt.title('Top 10 Products by Profit Margin %', fontweight='bold')
+    plt.xlabel('Profit Margin (%)')
+
+    # Chart 4: Product sales by region (heatmap for top products)
+    plt.subplot(2, 3, 4)
+    sns.heatmap(product_region_sales, annot=True, fmt='.0f', cmap='YlOrRd')
+    plt.title('Top 5 Products: Sales by Region', fontweight='bold')
+    plt.xlabel('Region')
+    plt.ylabel('Product')
+
+    # Chart 5: Product frequency (how often each product is sold)
+    plt.subplot(2, 3, 5)
+    product_frequency.plot(kind='bar', color='lightgreen')
+    plt.title('Top 10 Most Frequently Sold Products', fontweight='bold')
+    plt.ylabel('Number of Sales')
+    plt.xticks(rotation=45, ha='right')
+
+    # Chart 6: Average sale value by product
+    plt.subplot(2, 3, 6)
+    avg_sale_by_product.plot(kind='bar', color='gold')
+    plt.title('Top 10 Products by Average Sale Value', fontweight='bold')
+    plt.ylabel('Average Sale Value ($)')
+    plt.xticks(rotation=45, ha='right')
+
+    plt.tight_layout()
+
+
+def draw_seasonal_analysis(monthly_sales, quarterly_sales, seasonal_region, monthly_region, quarterly_profit,
+                           monthly_variance):
+    plt.figure(figsize=(20, 12))
+
+    # Chart 1: Monthly sales trend
+    plt.subplot(2, 3, 1)
+    monthly_sales.plot(kind='line', marker='o', color='blue', linewidth=2)
+    plt.title('Monthly Sales Trend', fontweight='bold', fontsize=14)
+    plt.ylabel('Total Sales ($)')
+    plt.xlabel('Month')
+    plt.xticks(rotation=45)
+    plt.grid(True, alpha=0.3)
+
+    # Chart 2: Quarterly sales
+    plt.subplot(2, 3, 2)
+    quarterly_sales.plot(kind='bar', color='green', alpha=0.7)
+    plt.title('Quarterly Sales', fontweight='bold', fontsize=14)
+    plt.ylabel('Total Sales ($)')
+    plt.xlabel('Quarter')
+    plt.xticks(rotation=0)
+
+    # Chart 3: Seasonal sales by region (heatmap)
+    plt.subplot(2, 3, 3)
+    sns.heatmap(seasonal_region, annot=True, fmt='.0f', cmap='YlOrRd')
+    plt.title('Seasonal Sales by Region', fontweight='bold', fontsize=14)
+    plt.xlabel('Quarter')
+    plt.ylabel('Region')
+
+    # Chart 4: Monthly sales by region
+    plt.subplot(2, 3, 4)
+    monthly_region.plot(kind='line', ax=plt.gca(), marker='o')
+    plt.title('Monthly Sales by Region', fontweight='bold', fontsize=14)
+    plt.ylabel('Total Sales ($)')
+    plt.xlabel('Month')
+    plt.xticks(rotation=45)
+    plt.legend(title='Region', bbox_to_anchor=(1.05, 1), loc='upper left')
+
+    # Chart 5: Seasonal profit analysis
+    plt.subplot(2, 3, 5)
+    quarterly_profit.plot(kind='bar', color='orange', alpha=0.7)
+    plt.title('Quarterly Profit', fontweight='bold', fontsize=14)
+    plt.ylabel('Total Profit ($)')
+    plt.xlabel('Quarter')
+    plt.xticks(rotation=0)
+
+    # Chart 6: Seasonal variance analysis
+    plt.subplot(2, 3, 6)
+    monthly_variance.plot(kind='bar', color='red', alpha=0.7)
+    plt.title('Monthly Sales Variance from Average (%)', fontweight='bold', fontsize=14)
+    plt.ylabel('Variance from Average (%)')
+    plt.xlabel('Month')
+    plt.xticks(rotation=45)
+    plt.axhline(y=100, color='black', linestyle='--', alpha=0.5, label='Average')
+    plt.legend()
+
+    plt.tight_layout()
+
+
+def draw_product_seasonal_analysis(top_product_month, quarterly_products, product_seasonal_variance,
+                                   peak_months_by_product, correlation_matrix):
+    plt.figure(figsize=(20, 15))
+
+    # Chart 1: Monthly sales for top 5 products
+    plt.subplot(2, 3, 1)
+    for product, product_monthly in top_product_month.iterrows():
+        plt.plot(range(12), product_monthly.values, marker='o', label=product, linewidth=2)
+
+    plt.title('Monthly Sales for Top 5 Products', fontweight='bold', fontsize=14)
+    plt.ylabel('Sales ($)')
+    plt.xlabel('Month')
+    plt.xticks(range(12), ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], rotation=45)
+    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    plt.grid(True, alpha=0.3)
+
+    # Chart 2: Quarterly sales for top 5 products
+    plt.subplot(2, 3, 2)
+    quarterly_products.plot(kind='bar', ax=plt.gca())
+    plt.title('Quarterly Sales for Top 5 Products', fontweight='bold', fontsize=14)
+    plt.ylabel('Sales ($)')
+    plt.xlabel('Product')
+    plt.xticks(rotation=45)
+    plt.legend(title='Quarter')
+
+    # Chart 3: Seasonal variance by product
+    plt.subplot(2, 3, 3)
+    variance_df = pd.DataFrame(list(product_seasonal_variance.items()), columns=['Product', 'Seasonal_Variance_%'])
+    sns.barplot(data=variance_df, x='Seasonal_Variance_%', y='Product', palette='viridis')
+    plt.title('Seasonal Variance by Product (%)', fontweight='bold', fontsize=14)
+    plt.xlabel('Seasonal Variance (%)')
+
+    # Chart 4: Product seasonal heatmap
+    plt.subplot(2, 3, 4)
+    sns.heatmap(quarterly_products, annot=True, fmt='.0f', cmap='YlOrRd')
+    plt.title('Top 5 Products: Sales by Quarter', fontweight='bold', fontsize=14)
+    plt.xlabel('Quarter')
+    plt.ylabel('Product')
+
+    # Chart 5: Peak months by product
+    plt.subplot(2, 3, 5)
+    peak_df = pd.DataFrame(list(peak_months_by_product.items()), columns=['Product', 'Peak_Month'])
+    peak_counts = peak_df['Peak_Month'].value_counts()
+    peak_counts.plot(kind='bar', color='orange', alpha=0.7)
+    plt.title('Peak Months Distribution', fontweight='bold', fontsize=14)
+    plt.ylabel('Number of Products')
+    plt.xlabel('Month')
+    plt.xticks(rotation=45)
+
+    # Chart 6: Product seasonality correlation
+    plt.subplot(2, 3, 6)
+    sns.heatmap(correlation_matrix, annot=True, cmap='coolwarm', center=0)
+    plt.title('Product Seasonality Correlation', fontweight='bold', fontsize=14)
+
+    plt.tight_layout()
+
+
+def draw_order_value_analysis(household_order_metrics):
+    plt.figure(figsize=(15, 10))
+
+    # Chart 1: Average Order Value by Region
+    plt.subplot(2, 3, 1)
+    sns.barplot(data=household_order_metrics, x='Region', y='Avg_Order_Value', palette='viridis')
+    plt.title('Average Order Value by Region', fontweight='bold', fontsize=14)
+    plt.ylabel('Average Order Value ($)')
+    plt.xticks(rotation=45)
+
+    # Chart 2: Orders per Household by Region
+    plt.subplot(2, 3, 2)
+    sns.barplot(data=household_order_metrics, x='Region', y='Orders_per_Household', palette='viridis')
+    plt.title('Orders per Household by Region', fontweight='bold', fontsize=14)
+    plt.ylabel('Orders per Household')
+    plt.xticks(rotation=45)
+
+    # Chart 3: Total Revenue per Household by Region
+    plt.subplot(2, 3, 3)
+    sns.barplot(data=household_order_metrics, x='Region', y='Total_Revenue_per_Household', palette='viridis')
+    plt.title('Total Revenue per Household by Region', fontweight='bold', fontsize=14)
+    plt.ylabel('Total Revenue per Household ($)')
+    plt.xticks(rotation=45)
+
+    # Chart 4: Scatter plot: Orders vs Order Value
+    plt.subplot(2, 3, 4)
+    plt.scatter(household_order_metrics['Orders_per_Household'], household_order_metrics['Avg_Order_Value'],
+                s=200, alpha=0.7, c=['red', 'blue', 'green', 'orange'])
+    for i, region in enumerate(household_order_metrics['Region']):
+        plt.annotate(region, (household_order_metrics['Orders_per_Household'].iloc[i],
+                              household_order_metrics['Avg_Order_Value'].iloc[i]),
+                     xytext=(5, 5), textcoords='offset points')
+    plt.title('Orders per Household vs Average Order Value', fontweight='bold', fontsize=14)
+    plt.xlabel('Orders per Household')
+    plt.ylabel('Average Order Value ($)')
+    plt.grid(True, alpha=0.3)
+
+    # Chart 5: Regional comparison (side by side)
+    plt.subplot(2, 3, 5)
+    x = range(len(household_order_metrics))
+    width = 0.25
+    plt.bar([i - width for i in x], household_order_metrics['Avg_Order_Value'], width, label='Avg Order Value', alpha=0.8)
+    plt.bar(x, household_order_metrics['Orders_per_Household'] * 1000, width, label='Orders per Household (×1000)', alpha=0.8)
+    plt.bar([i + width for i in x], household_order_metrics['Total_Revenue_per_Household'] / 1000, width, label='Revenue per Household (×1000)', alpha=0.8)
+    plt.title('Regional Metrics Comparison', fontweight='bold', fontsize=14)
+    plt.xlabel('Region')
+    plt.ylabel('Value')
+    plt.xticks(x, household_order_metrics['Region'], rotation=45)
+    plt.legend()
+
+    # Chart 6: Efficiency analysis
+    plt.subplot(2, 3, 6)
+    # Efficiency score (revenue per household / orders per household)
+    sns.barplot(data=household_order_metrics, x='Region', y='Efficiency_Score', palette='viridis')
+    plt.title('Customer Efficiency Score by Region', fontweight='bold', fontsize=14)
+    plt.ylabel('Efficiency Score (Revenue per Order)')
+    plt.xticks(rotation=45)
+
+    plt.tight_layout()
+
+
+CHARTS = {
+    'regional_sales': draw_regional_sales,
+    'household_metrics': draw_household_metrics,
+    'profit_per_sale': draw_profit_per_sale,
+    'channel_analysis': draw_channel_analysis,
+    'product_analysis': draw_product_analysis,
+    'seasonal_analysis': draw_seasonal_analysis,
+    'product_seasonal_analysis': draw_product_seasonal_analysis,
+    'order_value_analysis': draw_order_value_analysis,
+}
+
+
+def chart_hash(name, data, dpi, fmt):
+    # Changes whenever the chart's tables, its drawing code or the output
+    # settings change
+    digest = hashlib.sha256()
+    digest.update(f'{name}|{dpi}|{fmt}|'.encode())
+    digest.update(inspect.getsource(CHARTS[name]).encode())
+    for key in sorted(data):
+        value = data[key]
+        digest.update(key.encode())
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+            labels = list(value.columns) if isinstance(value, pd.DataFrame) else [value.name]
+            digest.update(repr((value.shape, labels, list(value.index.names))).encode())
+        else:
+            digest.update(pickle.dumps(value))
+    return digest.hexdigest()
+
+
+def _render(name, data, path, dpi):
+    # Also returns the trace spans recorded while rendering (in a worker
+    # process they would otherwise be lost)
+    mark = TRACER.mark()
+    start = time.perf_counter()
+    with span(f'draw {name}', 'chart'):
+        CHARTS[name](**data)
+    with span(f'savefig {name}', 'chart'):
+        plt.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close('all')
+    return name, time.perf_counter() - start, TRACER.since(mark)
+
+
+def _pool_context():
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def render_charts(charts, output_dir='.', dpi=300, fmt='png', workers=None, force=False):
+    # Render {chart name: tables} to output_dir/<name>.<fmt> in a process pool
+    # on the Agg backend. A chart file whose tables, code, dpi and format hash
+    # the same as on its last render (and which still exists) is skipped; the
+    # manifest is keyed by file name, so each format is tracked on its own.
+    # Returns {name: {'path': ..., 'status': 'rendered' | 'unchanged', 'seconds': ...}}.
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, CHART_MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    results = {}
+    pending = {}
+    for name, data in charts.items():
+        path = os.path.join(output_dir, f'{name}.{fmt}')
+        digest = chart_hash(name, data, dpi, fmt)
+        if not force and manifest.get(os.path.basename(path)) == digest and os.path.exists(path):
+            results[name] = {'path': path, 'status': 'unchanged', 'seconds': 0.0}
+        else:
+            pending[name] = (data, path, digest)
+
+    if pending:
+        if workers is None:
+            workers = min(len(pending), os.cpu_count() or 1)
+        jobs = [(name, data, path, dpi) for name, (data, path, _) in pending.items()]
+        if workers <= 1 or len(jobs) == 1:
+            rendered = [_render(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+                rendered = list(pool.map(_render, *zip(*jobs)))
+        for name, seconds, spans in rendered:
+            TRACER.extend(spans)
+            data, path, digest = pending[name]
+            manifest[os.path.basename(path)] = digest
+            results[name] = {'path': path, 'status': 'rendered', 'seconds': seconds}
+
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    return {name: results[name] for name in charts}
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+from calendar_dim import MONTH_NAMES, month_name
+from instrument import span
+
+# Finest grain kept by the cube; every table in eda.py rolls up from it
+CUBE_DIMENSIONS = ['Region', 'Channel', 'Product Name', 'Year', 'Month']
+CUBE_MEASURES = ['Line Total', 'Total Unit Cost', 'Profit']
+
+# Dimensions that are not stored in the cube but follow from one that is
+DERIVED_DIMENSIONS = {
+    'Quarter': lambda cells: (cells['Month'] - 1) // 3 + 1,
+    'Month_Name': lambda cells: month_name(cells['Month']),
+}
+
+
+class SalesCube:
+    # Sum, count and sum of squares of each measure per cell of
+    # Region x Channel x Product x Year x Month, built with one pass over the
+    # sales rows. Sums, counts, means and variances for any coarser grouping
+    # are rolled up from these cells instead of rescanning the rows.
+    # Values of `first` columns (e.g. households) are kept as of the first
+    # sales row of each cell, matching groupby(...).agg('first').
+    #
+    # Rows with a missing dimension value (an orphan Region or Product key, a
+    # missing date) keep a cell of their own with that value missing, so they
+    # still count towards every grouping that does not involve the missing
+    # dimension; groupings by it leave them out, as a groupby on the rows does.
+
+    def __init__(self, cells, dimensions, measures, first, rows_in=None):
+        self.cells = cells
+        self.dimensions = dimensions
+        self.measures = measures
+        self.first = first
+        # Sales rows the cube was built from; first_row counts positions in them
+        self.rows_in = int(cells['rows'].sum()) if rows_in is None else rows_in
+
+    @classmethod
+    def build(cls, df, dimensions=CUBE_DIMENSIONS, measures=CUBE_MEASURES, first=('households',)):
+        dimensions = list(dimensions)
+        measures = list(measures)
+        first = [c for c in first if c in df.columns]
+
+        columns = {'first_row': np.arange(len(df))}
+        aggregations = {'rows': ('first_row', 'size'), 'first_row': ('first_row', 'min')}
+        for measure in measures:
+            values = df[measure].to_numpy(np.float64)
+            columns[measure] = values
+            columns[f'{measure}__sq'] = values * values
+            aggregations[f'{measure}__sum'] = (measure, 'sum')
+            aggregations[f'{measure}__count'] = (measure, 'count')
+            aggregations[f'{measure}__sumsq'] = (f'{measure}__sq', 'sum')
+        for column in first:
+            columns[column] = df[column].to_numpy()
+            aggregations[f'{column}__first'] = (column, 'first')
+
+        work = pd.DataFrame(columns, index=df.index)
+        for dimension in dimensions:
+            work[dimension] = df[dimension]
+        with span('cube build', 'groupby', rows_in=len(df)) as s:
+            cells = work.groupby(dimensions, observed=True, dropna=False).agg(**aggregations).reset_index()
+            s.rows_out = len(cells)
+        return cls(cells, dimensions, measures, first, len(df))
+
+    def __len__(self):
+        return len(self.cells)
+
+    def merge(self, other):
+        # Combine two cubes over disjoint sets of rows; `other`'s rows are taken
+        # to come after this cube's rows when resolving `first` values.
+        other_cells = other.cells.copy()
+        other_cells['first_row'] += self.rows_in
+        cells = pd.concat([self.cells, other_cells], ignore_index=True)
+        rows_in = self.rows_in + other.rows_in
+        merged = SalesCube(cells, self.dimensions, self.measures, self.first, rows_in)
+        return SalesCube(merged._rollup(self.dimensions, dropna=False), self.dimensions, self.measures,
+                         self.first, rows_in)
+
+    def _rollup(self, by, where=None, dropna=True):
+        cells = self.cells
+        if where:
+            mask = np.ones(len(cells), dtype=bool)
+            for column, values in where.items():
+                mask &= np.asarray(self._dimension(cells, column).isin(list(values)))
+            cells = cells[mask]
+
+        work = pd.DataFrame({dimension: self._dimension(cells, dimension) for dimension in by})
+        sums = [c for c in cells.columns if c.endswith(('__sum', '__count', '__sumsq')) or c == 'rows']
+        for column in sums:
+            work[column] = cells[column].to_numpy()
+        work['first_row'] = cells['first_row'].to_numpy()
+        with span(f"cube rollup {', '.join(by)}", 'groupby', rows_in=len(cells)) as s:
+            grouped = work.groupby(by, observed=True, dropna=dropna)
+            rolled = grouped[sums].sum()
+            rolled['first_row'] = grouped['first_row'].min()
+
+            # `first` values come from the cell holding the group's earliest row
+            for column in self.first:
+                earliest = work['first_row'].groupby([work[d] for d in by], observed=True, dropna=dropna).idxmin()
+                rolled[f'{column}__first'] = cells[f'{column}__first'].loc[earliest.to_numpy()].to_numpy()
+            s.rows_out = len(rolled)
+        return rolled.reset_index()
+
+    def _dimension(self, cells, dimension):
+        if dimension in cells.columns:
+            return cells[dimension]
+        if dimension in DERIVED_DIMENSIONS:
+            return pd.Series(DERIVED_DIMENSIONS[dimension](cells), index=cells.index, name=dimension)
+        raise KeyError(f"'{dimension}' is not a cube dimension")
+
+    def agg(self, by, spec, where=None):
+        # Equivalent of df.groupby(by).agg(spec) for spec values 'sum', 'mean',
+        # 'count', 'var', 'std' on measures and 'first' on `first` columns.
+        # `where` restricts the cube to {dimension: allowed values} first.
+        keys = [by] if isinstance(by, str) else list(by)
+        rolled = self._rollup(keys, where).set_index(keys)
+        result = pd.DataFrame(index=rolled.index)
+        for column, how in spec.items():
+            if how == 'first':
+                result[column] = rolled[f'{column}__first']
+                continue
+            total = rolled[f'{column}__sum']
+            count = rolled[f'{column}__count']
+            if how == 'sum':
+                result[column] = total
+            elif how == 'count':
+                result[column] = count
+            elif how == 'mean':
+                result[column] = total / count
+            elif how in ('var', 'std'):
+                var = (rolled[f'{column}__sumsq'] - total * total / count) / (count - 1)
+                result[column] = np.sqrt(var.clip(lower=0)) if how == 'std' else var.clip(lower=0)
+            else:
+                raise ValueError(f"Unsupported aggregation '{how}' for '{column}'")
+        return result
+
+    def sum(self, by, measure, where=None):
+        return self.agg(by, {measure: 'sum'}, where)[measure]
+
+    def mean(self, by, measure, where=None):
+        return self.agg(by, {measure: 'mean'}, where)[measure]
+
+    def count(self, by, where=None):
+        # Number of sales rows per group, like value_counts() on the row level
+        keys = [by] if isinstance(by, str) else list(by)
+        return self._rollup(keys, where).set_index(keys)['rows'].rename('count')
@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+
+from instrument import span
+from star_schema import Dimension
+
+# Customer-level RFM segmentation. The sales rows are joined to the
+# Customers sheet on the integer customer key and every per-customer figure
+# comes out of one pass of bincounts over the customers' row positions:
+#
+#   Recency     days from the customer's last order to the as-of date
+#   Frequency   distinct orders
+#   Monetary    revenue (Line Total)
+#   Margin      profit, and profit as % of revenue
+#
+# plus the customer's revenue in every Region and Channel, which is what the
+# segment reports by Region and Channel are summed from. Recency, frequency
+# and monetary value are scored 1-5 by quintile (5 = most recent, most
+# frequent, highest spend) with np.quantile edges and one searchsorted, and
+# the scores map to named segments.
+
+CUSTOMER_KEY = 'Customer Name Index'
+SCORE_BINS = 5
+
+# Checked in order; the first rule a customer satisfies names its segment
+SEGMENT_RULES = [
+    ('Champions', lambda r, f, m: (r >= 4) & (f >= 4) & (m >= 4)),
+    ('Loyal', lambda r, f, m: (r >= 3) & (f >= 4)),
+    ('New', lambda r, f, m: (r >= 4) & (f <= 2)),
+    ('Promising', lambda r, f, m: (r >= 3) & (m >= 3)),
+    ('At Risk', lambda r, f, m: (r <= 2) & (f >= 3)),
+    ('Lost', lambda r, f, m: (r <= 2) & (f <= 2)),
+]
+SEGMENTS = [name for name, _ in SEGMENT_RULES] + ['Needs Attention']
+
+
+def quantile_scores(values, bins=SCORE_BINS):
+    # 1..bins by quantile of values; equal values always get the same score,
+    # missing values the lowest
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return np.ones(len(values), dtype=np.int8)
+    edges = np.quantile(values[valid], np.linspace(0, 1, bins + 1)[1:-1])
+    scores = (np.searchsorted(edges, values, side='right') + 1).astype(np.int8)
+    scores[~valid] = 1
+    return scores
+
+
+def segment(recency_score, frequency_score, monetary_score):
+    conditions = [rule(recency_score, frequency_score, monetary_score) for _, rule in SEGMENT_RULES]
+    codes = np.select(conditions, np.arange(len(SEGMENT_RULES)), default=len(SEGMENT_RULES))
+    return pd.Categorical.from_codes(codes, categories=SEGMENTS, ordered=True)
+
+
+def _per_customer(positions, customers, values):
+    return np.bincount(positions, weights=values, minlength=customers)
+
+
+def _spread(positions, customers, codes, size, values):
+    # customers x size matrix of values summed per customer and code
+    flat = positions * size + codes
+    return np.bincount(flat, weights=values, minlength=customers * size).reshape(customers, size)
+
+
+def customer_rfm(rows, customers, as_of=None):
+    # One row per customer with sales: RFM figures, scores and segment, plus
+    # ({'Region': matrix, 'Channel': matrix}, labels) of revenue per customer
+    # and Region/Channel for the segment reports
+    dimension = Dimension('Customers', customers, 'Customer Index')
+    with span('customer rfm', 'groupby', rows_in=len(rows)) as s:
+        positions = dimension.positions(rows[CUSTOMER_KEY].to_numpy())
+        matched = positions >= 0
+        positions = positions[matched]
+        n = len(dimension)
+
+        days = np.asarray(rows['OrderDate']).astype('datetime64[D]').astype(np.int64)[matched]
+        revenue = np.nan_to_num(rows['Line Total'].to_numpy(np.float64)[matched])
+        profit = np.nan_to_num(rows['Profit'].to_numpy(np.float64)[matched])
+        orders = pd.factorize(rows['OrderNumber'])[0][matched].astype(np.int64)
+        dated = rows['OrderDate'].notna().to_numpy()[matched]
+
+        lines = np.bincount(positions, minlength=n)
+        monetary = _per_customer(positions, n, revenue)
+        margin = _per_customer(positions, n, profit)
+        last_day = np.full(n, np.iinfo(np.int64).min)
+        np.maximum.at(last_day, positions[dated], days[dated])
+        # Rows without an OrderNumber count towards no order, as in nunique()
+        numbered = orders >= 0
+        stride = int(orders.max()) + 1 if numbered.any() else 1
+        frequency = np.bincount(pd.unique(positions[numbered] * stride + orders[numbered]) // stride, minlength=n)
+
+        spreads = {}
+        labels = {}
+        for column in ('Region', 'Channel'):
+            values = rows[column].astype('category')
+            codes = values.cat.codes.to_numpy().astype(np.int64)[matched]
+            known = codes >= 0
+            labels[column] = values.cat.categories
+            spreads[column] = _spread(positions[known], n, codes[known], len(labels[column]), revenue[known])
+
+        active = lines > 0
+        if as_of is None:
+            # The day after the last order in the data
+            as_of_day = int(days[dated].max()) + 1 if dated.any() else 0
+        else:
+            as_of_day = int(pd.Timestamp(as_of).to_datetime64().astype('datetime64[D]').astype(np.int64))
+        # Customers without a dated order have no recency (and no Last_Order:
+        # the int64 minimum is NaT)
+        has_date = last_day[active] > np.iinfo(np.int64).min
+        recency = np.full(int(active.sum()), np.nan)
+        recency[has_date] = as_of_day - last_day[active][has_date]
+        frequency = frequency[active]
+        monetary = monetary[active]
+        margin = margin[active]
+
+        # Low recency is good, so it is scored on its negative
+        r_score = quantile_scores(-recency)
+        f_score = quantile_scores(frequency)
+        m_score = quantile_scores(monetary)
+        table = dimension.table[active].reset_index(drop=True)
+        table = table.assign(
+            Last_Order=last_day[active].astype('datetime64[D]'),
+            Recency_Days=recency,
+            Frequency=frequency,
+            Monetary=monetary,
+            Profit=margin,
+            Margin_Percent=np.divide(margin * 100, monetary, out=np.full(len(monetary), np.nan), where=monetary != 0),
+            Lines=lines[active],
+            R_Score=r_score,
+            F_Score=f_score,
+            M_Score=m_score,
+            RFM_Score=r_score.astype(np.int16) * 100 + f_score * 10 + m_score,   # e.g. 545
+            Segment=segment(r_score, f_score, m_score),
+        )
+        spreads = {column: matrix[active] for column, matrix in spreads.items()}
+        s.rows_out = len(table)
+    return table, spreads, labels
+
+
+def _segment_report(table, matrix, labels, name):
+    # Customers and revenue per segment and Region/Channel from the
+    # customers x values revenue matrix
+    codes = table['Segment'].cat.codes.to_numpy()
+    revenue = np.zeros((len(SEGMENTS), matrix.shape[1]))
+    buyers = np.zeros((len(SEGMENTS), matrix.shape[1]), dtype=np.int64)
+    np.add.at(revenue, codes, matrix)
+    np.add.at(buyers, codes, matrix > 0)
+    index = pd.MultiIndex.from_product([pd.CategoricalIndex(SEGMENTS, categories=SEGMENTS, ordered=True), labels],
+                                       names=['Segment', name])
+    report = pd.DataFrame({'Customers': buyers.ravel(), 'Revenue': revenue.ravel()}, index=index)
+    report = report[report['Customers'] > 0]
+    report['Share_of_Segment_%'] = report['Revenue'] / report.groupby(level='Segment', observed=True)['Revenue'].transform('sum') * 100
+    return report
+
+
+def customer_tables(rows, customers, as_of=None):
+    table, spreads, labels = customer_rfm(rows, customers, as_of)
+    summary = table.groupby('Segment', observed=True).agg(
+        Customers=('Customer Index', 'size'),
+        Revenue=('Monetary', 'sum'),
+        Profit=('Profit', 'sum'),
+        Avg_Recency_Days=('Recency_Days', 'mean'),
+        Avg_Frequency=('Frequency', 'mean'),
+        Avg_Monetary=('Monetary', 'mean'),
+    )
+    summary['Share_of_Revenue_%'] = summary['Revenue'] / summary['Revenue'].sum() * 100
+    summary['Margin_Percent'] = summary['Profit'] / summary['Revenue'] * 100
+    return {
+        'customer_rfm': table,
+        'segment_summary': summary,
+        'segment_by_region': _segment_report(table, spreads['Region'], labels['Region'], 'Region'),
+        'segment_by_channel': _segment_report(table, spreads['Channel'], labels['Channel'], 'Channel'),
+    }
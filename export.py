@@ -0,0 +1,41 @@
+import json
+import os
+
+import pandas as pd
+
+TABLE_FORMATS = ['csv', 'parquet', 'json']
+
+
+def table_frame(table):
+    # A flat frame for any metrics table: Series become one column, grouping
+    # indexes become ordinary columns and column labels become strings
+    # (Parquet requires them; quarters and years are integers)
+    frame = table.to_frame() if isinstance(table, pd.Series) else table
+    if not (isinstance(frame.index, pd.RangeIndex) and frame.index.name is None):
+        frame = frame.reset_index()
+    frame = frame.copy()
+    frame.columns = [str(column) for column in frame.columns]
+    return frame
+
+
+def write_tables(tables, out_dir, fmt='csv'):
+    # One <name>.<fmt> file per table in out_dir plus an index.json listing
+    # them; returns {name: path}
+    if fmt not in TABLE_FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}', expected one of {TABLE_FORMATS}")
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for name, table in tables.items():
+        frame = table_frame(table)
+        path = os.path.join(out_dir, f'{name}.{fmt}')
+        if fmt == 'csv':
+            frame.to_csv(path, index=False)
+        elif fmt == 'parquet':
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_json(path, orient='records', date_format='iso', indent=2)
+        paths[name] = path
+    with open(os.path.join(out_dir, 'index.json'), 'w') as f:
+        json.dump({name: {'file': os.path.basename(path), 'rows': len(tables[name])}
+                   for name, path in paths.items()}, f, indent=2)
+    return paths
@@ -0,0 +1,216 @@
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+# HyperLogLog distinct counting (Flajolet et al. 2007) with 64-bit hashes.
+#
+# A sketch of precision p keeps m = 2**p one-byte registers, whatever the
+# number of values added. The relative standard error of count() is about
+# 1.04 / sqrt(m):
+#
+#     p = 10    1 KiB    3.3 %
+#     p = 12    4 KiB    1.6 %
+#     p = 14   16 KiB    0.8 %   (default)
+#     p = 16   64 KiB    0.4 %
+#
+# so ~95 % of estimates fall within two standard errors of the exact count.
+# count() uses Ertl's improved raw estimator ("New cardinality estimation
+# algorithms for HyperLogLog sketches", 2017), computed from the histogram
+# of register values. Unlike the original estimator, which switches from
+# linear counting to the raw estimate at 2.5 m and overestimates by a few
+# percent just above it, it is unbiased from small counts up to billions
+# of values without the empirical bias tables of HyperLogLog++.
+#
+# Sketches of the same precision merge losslessly by taking the
+# register-wise maximum, so they can be built per chunk, per worker process
+# or per incremental batch and combined afterwards. `python hll.py` checks
+# the estimates against the exact nunique over a range of cardinalities and
+# fails if one is off by more than three standard errors.
+
+DEFAULT_PRECISION = 14
+
+
+def hash_values(values):
+    # Stable 64-bit hashes (the same in every process and run). Strings hash
+    # the same whatever their pandas dtype; numbers only match numbers.
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    return pd.util.hash_pandas_object(series, index=False).to_numpy()
+
+
+def _bit_length(words):
+    # Exact bit length of uint64 values, done on 32-bit halves so the float
+    # exponent trick never rounds
+    high = (words >> np.uint64(32)).astype(np.float64)
+    low = (words & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+
+def _positions(hashes, precision):
+    # Register index from the top p bits, rank (leading zeros + 1) from the rest
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    index = (hashes >> np.uint64(64 - precision)).astype(np.intp)
+    rest = (hashes << np.uint64(precision)) | np.uint64(1 << (precision - 1))
+    rank = (65 - _bit_length(rest)).astype(np.uint8)
+    return index, rank
+
+
+def _sigma(x):
+    # x + sum over k >= 1 of x**(2**k) * 2**(k-1), for the share x of empty registers
+    if x == 1:
+        return np.inf
+    y = 1.0
+    z = x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x):
+    # Correction for the share x of registers at the largest possible value
+    if x == 0 or x == 1:
+        return 0.0
+    y = 1.0
+    z = 1 - x
+    while True:
+        x = np.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+def _estimate(registers):
+    # Cardinality estimate for one (m,) or many (groups, m) register arrays,
+    # with Ertl's improved raw estimator
+    registers = np.atleast_2d(registers)
+    groups, m = registers.shape
+    q = 64 - int(np.log2(m))
+    # Histogram of register values (0 to q + 1) per group
+    offsets = (np.arange(groups) * (q + 2))[:, np.newaxis]
+    histogram = np.bincount((registers + offsets).ravel(), minlength=groups * (q + 2)).reshape(groups, q + 2)
+    z = m * np.array([_tau(1 - c / m) for c in histogram[:, q + 1]])
+    for k in range(q, 0, -1):
+        z = 0.5 * (z + histogram[:, k])
+    z = z + m * np.array([_sigma(c / m) for c in histogram[:, 0]])
+    with np.errstate(divide='ignore'):
+        return m * m / (2 * np.log(2) * z)
+
+
+class HyperLogLog:
+    # Mergeable approximate distinct counter; see the notes at the top
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 18:
+            raise ValueError(f"precision must be between 4 and 18, got {precision}")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    @property
+    def relative_error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def add_hashes(self, hashes):
+        index, rank = _positions(hashes, self.precision)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def add(self, values):
+        return self.add_hashes(hash_values(values))
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge sketches of precision {self.precision} and {other.precision}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        return float(_estimate(self.registers)[0])
+
+    def __len__(self):
+        return int(round(self.count()))
+
+    def __repr__(self):
+        return f'HyperLogLog(precision={self.precision}, count~{self.count():.0f})'
+
+    def to_bytes(self):
+        return bytes([self.precision]) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[0], np.frombuffer(data[1:], dtype=np.uint8).copy())
+
+
+class HLLAgg:
+    # Groupby aggregation building one sketch per group, e.g.
+    #     df.groupby('Region')['OrderNumber'].agg(HLLAgg(14))
+    # For many groups, group_sketches() does the same in one vectorized pass.
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        self.__name__ = f'hll{precision}'
+
+    def __call__(self, values):
+        return HyperLogLog(self.precision).add(values)
+
+
+def group_sketches(keys, values, precision=DEFAULT_PRECISION):
+    # One sketch per distinct key: a (groups, m) register matrix filled with a
+    # single np.maximum.at over all rows. Returns a Series of HyperLogLog.
+    codes, groups = pd.factorize(pd.Series(keys), sort=True)
+    valid = codes >= 0
+    index, rank = _positions(hash_values(values)[valid], precision)
+    registers = np.zeros((len(groups), 1 << precision), dtype=np.uint8)
+    np.maximum.at(registers, (codes[valid], index), rank)
+    return pd.Series([HyperLogLog(precision, row) for row in registers], index=groups, dtype=object)
+
+
+def counts(sketches):
+    # Estimated distinct counts for a Series of sketches
+    if len(sketches) == 0:
+        return pd.Series(dtype=np.float64, index=sketches.index)
+    return pd.Series(_estimate(np.stack([s.registers for s in sketches])), index=sketches.index)
+
+
+def main():
+    # Check the estimates against the exact count over random data; exits
+    # with an error if any is off by more than three standard errors
+    parser = argparse.ArgumentParser(description='Check HyperLogLog estimates against exact distinct counts.')
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    precisions = (10, 12, 14, 16)
+    # Fixed cardinalities plus 2.6 m for every precision, just above where
+    # linear counting used to hand over to the raw estimate
+    cardinalities = sorted({100, 10_000, 1_000_000} | {int(2.6 * (1 << p)) for p in precisions})
+    failures = 0
+    print(f"{'precision':>9} {'distinct':>10} {'estimate':>12} {'error %':>8} {'std err %':>9}")
+    for distinct in cardinalities:
+        values = pd.Series(rng.integers(0, distinct, args.rows)).map('SO - {:07d}'.format)
+        exact = values.nunique()
+        hashes = hash_values(values)
+        for precision in precisions:
+            # Build from four chunks to exercise merging
+            sketch = HyperLogLog(precision)
+            for chunk in np.array_split(hashes, 4):
+                sketch.merge(HyperLogLog(precision).add_hashes(chunk))
+            estimate = sketch.count()
+            error = estimate / exact - 1
+            within = abs(error) <= 3 * sketch.relative_error
+            failures += not within
+            print(f"{precision:>9} {exact:>10} {estimate:>12.0f} {error * 100:>8.2f} "
+                  f"{sketch.relative_error * 100:>9.2f}{'' if within else '  FAILED'}")
+    if failures:
+        sys.exit(f'{failures} estimates off by more than three standard errors')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from cube import SalesCube
+from distinct import HLLDistinct, has_order_key, order_keys
+from hll import DEFAULT_PRECISION
+from loader import load_workbook
+from star_schema import sales_rows
+
+STATE_DIR = '.sales_state'
+DIMENSION_SHEETS = ['Customers', 'Products', 'Regions', 'State Regions']
+
+# Key runs are merged FANOUT at a time, once that many of the newest runs
+# are of the same size tier
+FANOUT = 4
+
+
+def read_orders(path):
+    # A batch of new Sales Orders rows as CSV, Parquet or an Excel sheet
+    if path.endswith('.csv'):
+        return pd.read_csv(path, parse_dates=['OrderDate'])
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_excel(path, sheet_name='Sales Orders')
+
+
+def _tier(size):
+    # Number of digits of the size in base FANOUT
+    tier = 0
+    while size >= FANOUT:
+        size //= FANOUT
+        tier += 1
+    return tier
+
+
+class OrderKeyStore:
+    # A set of order keys kept on disk as sorted .npy runs, each named after
+    # the generations it holds (run-<first>-<last>.npy). Adding a batch writes
+    # one new run, so it costs time proportional to the batch; lookups
+    # binary-search the memory-mapped runs.
+    #
+    # Runs are merged size-tiered: whenever the FANOUT newest runs are of the
+    # same tier (their size has the same number of digits in base FANOUT) they
+    # are merged into one run of a higher tier, which may cascade. Every key
+    # is rewritten once per tier, and there are at most FANOUT - 1 runs per
+    # tier while batches are of similar size. A merge only takes committed
+    # runs, writes the merged run under a new name and only then deletes the
+    # runs it replaces; runs left over by an interrupted merge are covered by
+    # the merged run's generations and deleted on the next open.
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _runs(self):
+        # [(first generation, last generation, path)], oldest first
+        runs = []
+        for path in glob.glob(os.path.join(self.directory, 'run-*.npy')):
+            parts = os.path.basename(path)[4:-4].split('-')
+            runs.append((int(parts[0]), int(parts[-1]), path))
+        return sorted(runs)
+
+    def discard_after(self, generation):
+        # Drop runs written by an append that never got to commit its
+        # metadata, and runs already merged into another
+        runs = self._runs()
+        for first, last, path in runs:
+            covered = any(f <= first and last <= l and (f, l) != (first, last) for f, l, _ in runs)
+            if last > generation or covered:
+                os.remove(path)
+
+    def contains(self, keys):
+        found = np.zeros(len(keys), dtype=bool)
+        for _, _, path in self._runs():
+            run = np.load(path, mmap_mode='r')
+            if len(run) == 0:
+                continue
+            positions = np.searchsorted(run, keys).clip(max=len(run) - 1)
+            found |= run[positions] == keys
+        return found
+
+    def add(self, keys, generation):
+        # `keys` must be unique and not yet in the store; the runs already in
+        # the store are all committed, so they are merged before the new one
+        # is written
+        self._merge()
+        np.save(os.path.join(self.directory, f'run-{generation:08d}-{generation:08d}.npy'), np.sort(keys))
+
+    def _merge(self):
+        runs = [(first, last, path, len(np.load(path, mmap_mode='r'))) for first, last, path in self._runs()]
+        while len(runs) >= FANOUT and len({_tier(size) for *_, size in runs[-FANOUT:]}) == 1:
+            merging = runs[-FANOUT:]
+            merged = np.sort(np.concatenate([np.load(path) for _, _, path, _ in merging]))
+            path = os.path.join(self.directory, f'run-{merging[0][0]:08d}-{merging[-1][1]:08d}.npy')
+            tmp = os.path.join(self.directory, 'merged.tmp.npy')
+            np.save(tmp, merged)
+            os.replace(tmp, path)
+            for _, _, old, _ in merging:
+                os.remove(old)
+            runs[-FANOUT:] = [(merging[0][0], merging[-1][1], path, len(merged))]
+
+    def __len__(self):
+        return sum(len(np.load(path, mmap_mode='r')) for _, _, path in self._runs())
+
+
+def summary_tables(cube, orders_by_region):
+    # The aggregates kept up to date by incremental appends
+    return {
+        'sales_by_region': cube.sum('Region', 'Line Total'),
+        'profit_by_region': cube.sum('Region', 'Profit'),
+        'channel_by_region': cube.sum(['Region', 'Channel'], 'Line Total').unstack(fill_value=0),
+        'monthly_sales': cube.sum('Month_Name', 'Line Total'),
+        'quarterly_sales': cube.sum('Quarter', 'Line Total'),
+        'product_totals': cube.agg('Product Name', {'Line Total': 'sum', 'Profit': 'sum'}),
+        'unique_orders': orders_by_region,
+    }
+
+
+class IncrementalAggregates:
+    # Persisted aggregates that new Sales Orders batches are folded into
+    # without revisiting earlier rows: the aggregate cube (regional, channel,
+    # monthly, quarterly and product totals) and the per-region distinct order
+    # counts. Only the batch is joined and aggregated on each append.
+    # Distinct orders are counted exactly with the on-disk key store, or with
+    # fixed-size HyperLogLog sketches when initialized with distinct='hll'.
+    #
+    # The cube and sketches of every generation go to files of their own
+    # (cube-<generation>.pkl); meta.json names the current generation and is
+    # replaced last, so an append that stops half-way leaves the previous
+    # generation intact. Files of other generations are deleted after the
+    # commit, or on the next open.
+
+    def __init__(self, state_dir=STATE_DIR):
+        self.state_dir = state_dir
+        with open(os.path.join(state_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.dimensions = {name: pd.read_pickle(self._path(f'{name}.pkl')) for name in DIMENSION_SHEETS}
+        self._discard_other_generations()
+        self.cube = None
+        if self.meta['generation']:
+            self.cube = SalesCube(pd.read_pickle(self._generation_path('cube')), **self.meta['cube'])
+        self.orders = None
+        self.sketches = None
+        if self.meta.get('distinct', 'exact') == 'exact':
+            self.orders = OrderKeyStore(self._path('orders'))
+            self.orders.discard_after(self.meta['generation'])
+        else:
+            sketches = pd.read_pickle(self._generation_path('sketches')) if self.meta['generation'] else {}
+            self.sketches = HLLDistinct.from_dict(self.meta['precision'], sketches)
+
+    def _path(self, name):
+        return os.path.join(self.state_dir, name)
+
+    def _generation_path(self, name, generation=None):
+        generation = self.meta['generation'] if generation is None else generation
+        return self._path(f'{name}-{generation:08d}.pkl')
+
+    def _discard_other_generations(self):
+        current = {self._generation_path(name) for name in ('cube', 'sketches')}
+        for name in ('cube', 'sketches'):
+            for path in glob.glob(self._path(f'{name}-*.pkl')):
+                if path not in current:
+                    os.remove(path)
+
+    @classmethod
+    def initialize(cls, frames, state_dir=STATE_DIR, distinct='exact', precision=DEFAULT_PRECISION):
+        # Start a fresh state from a full workbook load
+        if distinct not in ('exact', 'hll'):
+            raise ValueError(f"distinct must be 'exact' or 'hll', got '{distinct}'")
+        shutil.rmtree(state_dir, ignore_errors=True)
+        os.makedirs(state_dir)
+        for name in DIMENSION_SHEETS:
+            frames[name].to_pickle(os.path.join(state_dir, f'{name}.pkl'))
+        meta = {'generation': 0, 'rows': 0, 'orders_by_region': {}, 'cube': None,
+                'distinct': distinct, 'precision': precision}
+        with open(os.path.join(state_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        state = cls(state_dir)
+        state.append(frames['Sales Orders'])
+        return state
+
+    def append(self, orders):
+        frames = dict(self.dimensions)
+        frames['Sales Orders'] = orders
+        rows = sales_rows(frames)
+        generation = self.meta['generation'] + 1
+
+        batch_cube = SalesCube.build(rows)
+        self.cube = batch_cube if self.cube is None else self.cube.merge(batch_cube)
+
+        if self.orders is not None:
+            new_orders = self._add_exact_orders(rows, generation)
+        else:
+            before = int(self.sketches.counts().sum())
+            self.sketches.add(rows)
+            new_orders = int(self.sketches.counts().sum()) - before
+            self.meta['orders_by_region'] = {str(k): int(v) for k, v in self.sketches.counts().items()}
+            pd.to_pickle(self.sketches.to_dict(), self._generation_path('sketches', generation))
+        self.cube.cells.to_pickle(self._generation_path('cube', generation))
+
+        # The metadata is written last; it is what marks the append as done
+        self.meta.update({
+            'generation': generation,
+            'rows': self.meta['rows'] + len(rows),
+            'cube': {'dimensions': self.cube.dimensions, 'measures': self.cube.measures, 'first': self.cube.first,
+                     'rows_in': int(self.cube.rows_in)},
+        })
+        tmp = self._path('meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp, self._path('meta.json'))
+        self._discard_other_generations()
+        return {'rows': len(rows), 'new_orders': new_orders, 'total_rows': self.meta['rows']}
+
+    def _add_exact_orders(self, rows, generation):
+        # Orders not seen in any earlier batch (or earlier in this one)
+        matched = has_order_key(rows)
+        keys, first = np.unique(order_keys(rows)[matched], return_index=True)
+        new = ~self.orders.contains(keys)
+        regions = rows['Region'].to_numpy()[matched][first[new]]
+        counts = self.meta['orders_by_region']
+        for region, count in pd.Series(regions).value_counts().items():
+            counts[str(region)] = counts.get(str(region), 0) + int(count)
+        self.orders.add(keys[new], generation)
+        return int(new.sum())
+
+    def orders_by_region(self):
+        counts = pd.Series(self.meta['orders_by_region'], name='OrderNumber', dtype='int64')
+        counts.index.name = 'Region'
+        return counts.sort_index()
+
+    def tables(self):
+        return summary_tables(self.cube, self.orders_by_region())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep the sales aggregates up to date with new order batches.')
+    parser.add_argument('--state', default=STATE_DIR, help='directory holding the persisted aggregates')
+    commands = parser.add_subparsers(dest='command', required=True)
+    init = commands.add_parser('init', help='build the aggregates from the full workbook')
+    init.add_argument('--workbook', default='Regional Sales Dataset.xlsx')
+    init.add_argument('--distinct', choices=['exact', 'hll'], default='exact',
+                      help='count distinct orders exactly or with fixed-size HyperLogLog sketches')
+    init.add_argument('--precision', type=int, default=DEFAULT_PRECISION, help='HyperLogLog precision')
+    append = commands.add_parser('append', help='fold new Sales Orders rows into the aggregates')
+    append.add_argument('batch', help='CSV, Parquet or Excel file of new Sales Orders rows')
+    commands.add_parser('show', help='print the current aggregates')
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        frames, _ = load_workbook(args.workbook)
+        state = IncrementalAggregates.initialize(frames, args.state, args.distinct, args.precision)
+        print(f"Initialized {args.state} with {state.meta['rows']} sales rows")
+    elif args.command == 'append':
+        state = IncrementalAggregates(args.state)
+        result = state.append(read_orders(args.batch))
+        print(f"Appended {result['rows']} rows ({result['new_orders']} new orders), "
+              f"{result['total_rows']} rows in total")
+    else:
+        for name, table in IncrementalAggregates(args.state).tables().items():
+            print(f"\n{name}:")
+            print(table)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import csv
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Lightweight tracing of the hot paths: sheet loads, dimension joins, cube
+# builds and roll-ups, chart drawing and savefig. Every span records
+#
+#   wall_ms    elapsed time
+#   cpu_ms     CPU time of this process (time.process_time)
+#   peak_mb    peak traced allocation above what was live when it started
+#              (only with memory=True; tracemalloc slows the run 2-4x)
+#   rows_in    rows going in, where that is meaningful
+#   rows_out   rows (or cells) coming out
+#
+# Tracing is off until TRACER.enable() and then costs one context manager
+# per span. Spans recorded in worker processes are shipped back with
+# TRACER.since() / TRACER.extend(). The trace is written as JSON or CSV
+# (write()) or as a Chrome trace for chrome://tracing or Perfetto
+# (write_chrome()).
+
+FIELDS = ['name', 'category', 'start_ms', 'wall_ms', 'cpu_ms', 'peak_mb', 'rows_in', 'rows_out', 'depth', 'pid']
+
+
+class _NullSpan:
+    # Stands in for a span while tracing is off; attribute writes are ignored
+    rows_in = None
+    rows_out = None
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, name, category, rows_in, depth):
+        self.name = name
+        self.category = category
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.depth = depth
+        self.memory_start = 0
+        self.memory_peak = 0
+
+
+class Tracer:
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.spans = []
+        self._stack = []
+        self.origin = time.perf_counter()
+
+    def enable(self, memory=True):
+        self.enabled = True
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return self
+
+    def disable(self):
+        self.enabled = False
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.memory = False
+
+    def clear(self):
+        self.spans = []
+        self.origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name, category='step', rows_in=None):
+        if not self.enabled:
+            yield _NULL_SPAN
+            return
+        current = Span(name, category, rows_in, len(self._stack))
+        if self.memory:
+            memory, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                parent = self._stack[-1]
+                parent.memory_peak = max(parent.memory_peak, peak)
+            tracemalloc.reset_peak()
+            current.memory_start = current.memory_peak = memory
+        self._stack.append(current)
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield current
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+            self._stack.pop()
+            peak_mb = None
+            if self.memory:
+                current.memory_peak = max(current.memory_peak, tracemalloc.get_traced_memory()[1])
+                peak_mb = (current.memory_peak - current.memory_start) / 2**20
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent.memory_peak = max(parent.memory_peak, current.memory_peak)
+            self.spans.append({
+                'name': name,
+                'category': category,
+                'start_ms': (start - self.origin) * 1000,
+                'wall_ms': wall * 1000,
+                'cpu_ms': cpu * 1000,
+                'peak_mb': peak_mb,
+                'rows_in': current.rows_in,
+                'rows_out': current.rows_out,
+                'depth': current.depth,
+                'pid': os.getpid(),
+            })
+
+    def mark(self):
+        return len(self.spans)
+
+    def since(self, mark):
+        # Spans recorded after mark(), e.g. to return them from a worker
+        return self.spans[mark:]
+
+    def extend(self, spans):
+        # Add spans shipped back from worker processes. Spans from this
+        # process are already recorded (the work ran in-process) and skipped.
+        pid = os.getpid()
+        self.spans.extend(s for s in spans if s['pid'] != pid)
+
+    def to_frame(self):
+        return pd.DataFrame(self.spans, columns=FIELDS)
+
+    def summary(self):
+        # Total wall/CPU time, worst peak and call count per category and name
+        frame = self.to_frame()
+        if frame.empty:
+            return frame
+        return (frame.groupby(['category', 'name'], sort=False)
+                .agg(calls=('wall_ms', 'size'), wall_ms=('wall_ms', 'sum'), cpu_ms=('cpu_ms', 'sum'),
+                     peak_mb=('peak_mb', 'max'), rows_out=('rows_out', 'max'))
+                .sort_values('wall_ms', ascending=False))
+
+    def write(self, path):
+        # JSON (a list of spans) or CSV (one row per span), by file extension
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDS)
+                writer.writeheader()
+                writer.writerows(self.spans)
+        else:
+            with open(path, 'w') as f:
+                json.dump({'spans': self.spans}, f, indent=2, default=_json_default)
+        return path
+
+    def write_chrome(self, path):
+        # Complete ('X') events in the Trace Event Format
+        events = []
+        for s in self.spans:
+            events.append({
+                'name': s['name'],
+                'cat': s['category'],
+                'ph': 'X',
+                'ts': s['start_ms'] * 1000,
+                'dur': s['wall_ms'] * 1000,
+                'pid': s['pid'],
+                'tid': s['pid'],
+                'args': {key: s[key] for key in ('cpu_ms', 'peak_mb', 'rows_in', 'rows_out') if s[key] is not None},
+            })
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=_json_default)
+        return path
+
+
+def _json_default(value):
+    # numpy integers and floats from len()/sum() on frames
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+TRACER = Tracer()
+
+
+def span(name, category='step', rows_in=None):
+    # TRACER.span(); the module-level form is what the hot paths call
+    return TRACER.span(name, category, rows_in)
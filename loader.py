@@ -0,0 +1,254 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from calendar_dim import parse_dates
+from instrument import TRACER, span
+
+try:
+    import pyarrow  # noqa: F401  (only needed for the Parquet cache)
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+CACHE_DIR = '.sheet_cache'
+MANIFEST = 'manifest.json'
+
+# Part of every cache key: bump it whenever the cached sheets would come out
+# different for the same workbook (date parsing, dtypes, file layout), so
+# caches written by older code are dropped instead of read back
+CACHE_VERSION = 1
+
+# (sheet name, header row) for every sheet of the Regional Sales workbook.
+# 'State Regions' has a title row above its real header.
+SHEETS = [
+    ('Sales Orders', 0),
+    ('Customers', 0),
+    ('Products', 0),
+    ('Regions', 0),
+    ('State Regions', 1),
+    ('2017 Budgets', 0),
+]
+
+# Date columns parsed to datetime64 when a sheet is read, so the cache holds
+# them parsed and later steps never convert them again
+DATE_COLUMNS = {
+    'Sales Orders': ['OrderDate'],
+}
+
+# Annual budget sheets, one per year ('2017 Budgets', '2018 Budgets', ...)
+BUDGET_SHEET = re.compile(r'^(\d{4}) Budgets$')
+
+
+def _sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(cache_dir, manifest):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = os.path.join(cache_dir, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(cache_dir, MANIFEST))
+
+
+def workbook_fingerprint(path, cache_dir=CACHE_DIR):
+    # Size and mtime are cheap to check; the content hash is only recomputed
+    # when one of them (or CACHE_VERSION) changes, so an unchanged workbook is
+    # never re-read.
+    st = os.stat(path)
+    manifest = _read_manifest(cache_dir)
+    key = os.path.abspath(path)
+    entry = manifest.get(key)
+    if (entry and entry.get('version') == CACHE_VERSION
+            and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns):
+        return entry
+
+    new_entry = {'version': CACHE_VERSION, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': _sha256(path)}
+    new_entry['key'] = f"v{CACHE_VERSION}-{new_entry['size']}-{new_entry['sha256'][:16]}"
+
+    # The workbook or the cache format changed: drop the sheets cached for
+    # the old key
+    if entry and entry.get('key') != new_entry['key']:
+        shutil.rmtree(os.path.join(cache_dir, entry['key']), ignore_errors=True)
+
+    manifest[key] = new_entry
+    _write_manifest(cache_dir, manifest)
+    return new_entry
+
+
+def sheet_names(path, cache_dir=CACHE_DIR):
+    # The workbook's sheet names, remembered with its fingerprint
+    fingerprint = workbook_fingerprint(path, cache_dir)
+    if 'sheets' not in fingerprint:
+        with pd.ExcelFile(path) as book:
+            fingerprint['sheets'] = list(book.sheet_names)
+        manifest = _read_manifest(cache_dir)
+        manifest[os.path.abspath(path)] = fingerprint
+        _write_manifest(cache_dir, manifest)
+    return fingerprint['sheets']
+
+
+def workbook_sheets(path, cache_dir=CACHE_DIR):
+    # SHEETS plus any further 'YYYY Budgets' sheets the workbook has
+    known = {name for name, _ in SHEETS}
+    extra = [(name, 0) for name in sheet_names(path, cache_dir) if BUDGET_SHEET.match(name) and name not in known]
+    return SHEETS + extra
+
+
+def _sheet_stem(cache_dir, fingerprint, sheet_name, header):
+    slug = re.sub(r'[^0-9A-Za-z]+', '_', sheet_name).strip('_').lower()
+    return os.path.join(cache_dir, fingerprint['key'], f'{slug}-h{header}')
+
+
+def _write_cache(df, stem):
+    os.makedirs(os.path.dirname(stem), exist_ok=True)
+
+    # Parquet is preferred, but only kept if it round-trips every dtype exactly;
+    # anything it cannot represent (mixed object columns etc.) is pickled instead.
+    if HAVE_PYARROW:
+        tmp = stem + '.parquet.tmp'
+        try:
+            df.to_parquet(tmp, index=False)
+            back = pd.read_parquet(tmp)
+            if back.columns.equals(df.columns) and back.dtypes.equals(df.dtypes):
+                os.replace(tmp, stem + '.parquet')
+                return stem + '.parquet'
+        except (ValueError, TypeError, NotImplementedError, ImportError, pyarrow.ArrowException):
+            pass
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    tmp = stem + '.pkl.tmp'
+    df.to_pickle(tmp)
+    os.replace(tmp, stem + '.pkl')
+    return stem + '.pkl'
+
+
+def read_cached_sheet(path, sheet_name, header=0, cache_dir=CACHE_DIR):
+    # Returns the cached DataFrame for this sheet, or None on a cache miss
+    stem = _sheet_stem(cache_dir, workbook_fingerprint(path, cache_dir), sheet_name, header)
+    if HAVE_PYARROW and os.path.exists(stem + '.parquet'):
+        return pd.read_parquet(stem + '.parquet')
+    if os.path.exists(stem + '.pkl'):
+        return pd.read_pickle(stem + '.pkl')
+    return None
+
+
+def write_cached_sheet(df, path, sheet_name, header=0, cache_dir=CACHE_DIR):
+    stem = _sheet_stem(cache_dir, workbook_fingerprint(path, cache_dir), sheet_name, header)
+    return _write_cache(df, stem)
+
+
+def _parse_dates(df, sheet_name):
+    for column in DATE_COLUMNS.get(sheet_name, []):
+        if column in df.columns:
+            df[column] = parse_dates(df[column])
+    return df
+
+
+def load_sheet_cached(path, sheet_name, header=0, cache_dir=CACHE_DIR):
+    # Parse the sheet with openpyxl once, then serve it from the columnar cache
+    # until the workbook's size, mtime or content hash changes.
+    df = read_cached_sheet(path, sheet_name, header, cache_dir)
+    if df is None:
+        df = _parse_dates(pd.read_excel(path, sheet_name=sheet_name, header=header), sheet_name)
+        write_cached_sheet(df, path, sheet_name, header, cache_dir)
+    return df
+
+
+_workbook_bytes = None
+
+
+def _init_worker(data):
+    global _workbook_bytes
+    _workbook_bytes = data
+
+
+def _parse_sheet(sheet_name, header, data=None):
+    # Also returns the trace spans recorded while parsing (in a worker process
+    # they would otherwise be lost)
+    mark = TRACER.mark()
+    start = time.perf_counter()
+    with span(f'parse {sheet_name}', 'load') as s:
+        df = pd.read_excel(io.BytesIO(data if data is not None else _workbook_bytes),
+                           sheet_name=sheet_name, header=header)
+        df = _parse_dates(df, sheet_name)
+        s.rows_out = len(df)
+    return sheet_name, df, time.perf_counter() - start, TRACER.since(mark)
+
+
+def _pool_context():
+    # Workers only need the module-level parser, so fork them where possible
+    # instead of re-importing the calling script.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def load_workbook(path, sheets=SHEETS, cache_dir=CACHE_DIR, use_cache=True, workers=None):
+    # Load every sheet of the workbook in one go. Cached sheets are read from
+    # the columnar cache; the rest are parsed concurrently from a single read
+    # of the workbook, so a cold start costs about as much as the largest sheet.
+    # Returns ({sheet: DataFrame}, {sheet: {'seconds': ..., 'source': ...}}).
+    frames = {}
+    timings = {}
+    missing = []
+    for sheet_name, header in sheets:
+        start = time.perf_counter()
+        with span(f'read cached {sheet_name}', 'load') as s:
+            df = read_cached_sheet(path, sheet_name, header, cache_dir) if use_cache else None
+            s.rows_out = None if df is None else len(df)
+        if df is None:
+            missing.append((sheet_name, header))
+        else:
+            frames[sheet_name] = df
+            timings[sheet_name] = {'seconds': time.perf_counter() - start, 'source': 'cache'}
+
+    if missing:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if workers is None:
+            workers = min(len(missing), os.cpu_count() or 1)
+
+        if workers <= 1 or len(missing) == 1:
+            results = [_parse_sheet(name, header, data) for name, header in missing]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context(),
+                                     initializer=_init_worker, initargs=(data,)) as pool:
+                futures = [pool.submit(_parse_sheet, name, header) for name, header in missing]
+                results = [future.result() for future in futures]
+
+        headers = dict(missing)
+        for sheet_name, df, seconds, spans in results:
+            TRACER.extend(spans)
+            frames[sheet_name] = df
+            timings[sheet_name] = {'seconds': seconds, 'source': 'excel'}
+            if use_cache:
+                with span(f'write cache {sheet_name}', 'load', rows_in=len(df)):
+                    write_cached_sheet(df, path, sheet_name, headers[sheet_name], cache_dir)
+
+    # Keep the order the sheets were requested in
+    frames = {name: frames[name] for name, _ in sheets}
+    timings = {name: timings[name] for name, _ in sheets}
+    return frames, timings
@@ -0,0 +1,147 @@
+from cube import MONTH_NAMES
+from instrument import span
+from seasonality import product_month_matrix, seasonality_correlation, seasonality_summary
+from topk import rankings, top_k_rows
+
+# The tables behind Steps 3-12 of eda.py. Everything except the distinct
+# order counts is rolled up from the aggregate cube, so the same functions
+# serve a full in-memory run, the incremental state and the chunked pipeline.
+
+
+def orders_by_region(rows):
+    # Distinct orders per region, counted on the sales rows
+    with span('distinct orders by region', 'groupby', rows_in=len(rows)) as s:
+        orders = rows.groupby('Region', observed=True)['OrderNumber'].nunique()
+        s.rows_out = len(orders)
+    return orders
+
+
+def regional_sales_tables(cube):
+    # Steps 3-4
+    return {
+        'sales_by_geographic_region': cube.sum('Region', 'Line Total').sort_values(ascending=False),
+    }
+
+
+def year_region_tables(cube):
+    # Step 5
+    return {
+        'sales_by_year_region': cube.sum(['Year', 'Region'], 'Line Total').reset_index(),
+    }
+
+
+def household_tables(cube):
+    # Step 6
+    region_metrics = cube.agg('Region', {
+        'Line Total': 'sum',           # Total revenue
+        'Profit': 'sum',               # Total profit
+        'households': 'first'          # Households (should be same for all records in a region)
+    }).reset_index()
+    region_metrics['Revenue_per_Household'] = region_metrics['Line Total'] / region_metrics['households']
+    region_metrics['Profit_per_Household'] = region_metrics['Profit'] / region_metrics['households']
+    return {'region_metrics': region_metrics}
+
+
+def profit_per_sale_tables(cube):
+    # Step 7
+    profit_per_sale = cube.agg('Region', {
+        'Profit': 'mean',              # Average profit per sale
+        'Line Total': 'mean',          # Average revenue per sale
+        'Total Unit Cost': 'mean'      # Average cost per sale
+    }).reset_index()
+    profit_per_sale['Profit_Margin_Percent'] = (profit_per_sale['Profit'] / profit_per_sale['Line Total']) * 100
+    return {'profit_per_sale': profit_per_sale}
+
+
+def channel_tables(cube):
+    # Step 8
+    channel_by_region = cube.sum(['Region', 'Channel'], 'Line Total').unstack(fill_value=0)
+    return {
+        'channel_counts': cube.count('Channel').sort_values(ascending=False),
+        'channel_by_region': channel_by_region,
+        'channel_percentages': channel_by_region.div(channel_by_region.sum(axis=1), axis=0) * 100,
+        'profit_by_channel': cube.mean('Channel', 'Profit'),
+    }
+
+
+def product_tables(cube, k=10):
+    # Step 9. Every ranking is a partial top-k selection over the per-product
+    # totals, rolled up once, rather than a full sort per ranking.
+    totals = cube.agg('Product Name', {'Line Total': 'sum', 'Profit': 'sum'})
+    product_margins = cube.agg('Product Name', {
+        'Profit': 'mean',
+        'Line Total': 'mean'
+    }).reset_index()
+    product_margins['Profit_Margin_Percent'] = (product_margins['Profit'] / product_margins['Line Total']) * 100
+    ranked = rankings(totals, ['Line Total', 'Profit'], k)
+    top_products = ranked['Line Total']
+    top_5_products = top_products.head(5).index
+    averages = product_margins.set_index('Product Name')
+    return {
+        'top_products': top_products,
+        'top_products_profit': ranked['Profit'],
+        'product_margins': product_margins,
+        'top_margin_products': top_k_rows(product_margins, 'Profit_Margin_Percent', k),
+        'product_region_sales': cube.sum(['Product Name', 'Region'], 'Line Total',
+                                         where={'Product Name': top_5_products}).unstack(fill_value=0),
+        'product_frequency': rankings(cube.count('Product Name').to_frame(), ['count'], k)['count'],
+        'avg_sale_by_product': rankings(averages, ['Line Total'], k)['Line Total'],
+    }
+
+
+def seasonal_tables(cube):
+    # Step 10
+    monthly_sales = cube.sum('Month_Name', 'Line Total').reindex(MONTH_NAMES)
+    monthly_region = cube.sum(['Region', 'Month_Name'], 'Line Total').unstack(fill_value=0)
+    return {
+        'monthly_sales': monthly_sales,
+        'quarterly_sales': cube.sum('Quarter', 'Line Total'),
+        'seasonal_region': cube.sum(['Region', 'Quarter'], 'Line Total').unstack(fill_value=0),
+        'monthly_region': monthly_region.reindex(columns=MONTH_NAMES),
+        'quarterly_profit': cube.sum('Quarter', 'Profit'),
+        'monthly_variance': monthly_sales / monthly_sales.mean() * 100,
+    }
+
+
+def product_seasonal_tables(cube, top_products):
+    # Step 11: seasonality for every product, plus the top 5 slices charted
+    product_month = product_month_matrix(cube)
+    top_5_products = top_products.head(5).index
+    return {
+        'product_month': product_month,
+        'product_seasonality': seasonality_summary(product_month),
+        'quarterly_products': cube.sum(['Product Name', 'Quarter'], 'Line Total',
+                                       where={'Product Name': top_5_products}).unstack(fill_value=0),
+        'correlation_matrix': seasonality_correlation(product_month).loc[top_5_products, top_5_products],
+    }
+
+
+def order_value_tables(cube, orders):
+    # Step 12; `orders` is the distinct order count per region
+    household_order_metrics = cube.agg('Region', {
+        'Line Total': 'mean',           # Average order value
+        'households': 'first'           # Number of households
+    })
+    household_order_metrics.insert(1, 'OrderNumber', orders.reindex(household_order_metrics.index))
+    household_order_metrics = household_order_metrics.reset_index()
+
+    household_order_metrics['Orders_per_Household'] = household_order_metrics['OrderNumber'] / household_order_metrics['households']
+    household_order_metrics['Avg_Order_Value'] = household_order_metrics['Line Total']
+    household_order_metrics['Total_Revenue_per_Household'] = (household_order_metrics['Orders_per_Household'] * household_order_metrics['Avg_Order_Value'])
+    # Efficiency score (revenue per household / orders per household)
+    household_order_metrics['Efficiency_Score'] = household_order_metrics['Total_Revenue_per_Household'] / household_order_metrics['Orders_per_Household']
+    return {'household_order_metrics': household_order_metrics}
+
+
+def all_tables(cube, orders):
+    tables = {}
+    tables.update(regional_sales_tables(cube))
+    tables.update(year_region_tables(cube))
+    tables.update(household_tables(cube))
+    tables.update(profit_per_sale_tables(cube))
+    tables.update(channel_tables(cube))
+    tables.update(product_tables(cube))
+    tables.update(seasonal_tables(cube))
+    tables.update(product_seasonal_tables(cube, tables['top_products']))
+    tables.update(order_value_tables(cube, orders))
+    return tables
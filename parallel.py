@@ -0,0 +1,311 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from cube import CUBE_DIMENSIONS, CUBE_MEASURES, SalesCube
+from instrument import TRACER, span
+
+# Builds the sales cube on several cores. The fact table is split into
+# partitions by one cube dimension (Product Name by default, or Region), so
+# every cube cell falls in exactly one partition and combining the partial
+# cubes is a concatenation. Keys are assigned to partitions by their row
+# counts, largest first, so skewed data (a few products with most of the
+# sales) still splits into even partitions.
+#
+# The columns the cube needs go into shared memory once, as integer codes
+# (dimensions, and non-numeric `first` columns) or float64 (measures); the
+# workers map the same buffers, so only block names and offsets are pickled
+# on the way in and only the partial cells on the way out. Each worker
+# aggregates its rows with bincount over a combined integer cell key.
+# The result has the same cells as SalesCube.build() on the same rows; sums
+# can differ in the last digits, as pandas adds with compensated summation.
+
+PARTITION_DIMENSIONS = ['Product Name', 'Region']
+
+
+def _pool_context():
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def encode_column(column):
+    # Integer codes in the order groupby sorts the values (-1 for missing)
+    # and the values they stand for
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), column.dtype
+    codes, uniques = pd.factorize(column, sort=True)
+    return codes, uniques
+
+
+def decode_column(codes, values):
+    if isinstance(values, pd.CategoricalDtype):
+        return pd.Categorical.from_codes(codes, dtype=values)
+    if (codes < 0).any():
+        return pd.api.extensions.take(np.asarray(values), codes, allow_fill=True)
+    return values.take(codes)
+
+
+def _size(values):
+    return len(values.categories) if isinstance(values, pd.CategoricalDtype) else len(values)
+
+
+def encode_key(column):
+    # (codes, values, number of codes) like encode_column, but with missing
+    # values as one more code after the others, where groupby(dropna=False)
+    # puts them
+    codes, values = encode_column(column)
+    size = _size(values)
+    return np.where(codes < 0, size, codes), values, size + 1
+
+
+def decode_key(codes, values):
+    return decode_column(np.where(codes == _size(values), -1, codes), values)
+
+
+class SharedColumns:
+    # Named numpy arrays copied once into shared memory blocks. spec() is what
+    # a worker needs to map them again with attach().
+
+    def __init__(self, arrays):
+        self.blocks = {}
+        self.arrays = {}
+        try:
+            for name, array in arrays.items():
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                self.blocks[name] = block
+                self.arrays[name] = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+                self.arrays[name][:] = array
+        except BaseException:
+            self.close()
+            raise
+
+    def spec(self):
+        return {name: (self.blocks[name].name, array.shape, array.dtype.str) for name, array in self.arrays.items()}
+
+    def close(self):
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(spec):
+    # ({name: array view}, [blocks]); close the blocks once the views are dropped
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return arrays, blocks
+
+
+def assign_partitions(codes, partitions):
+    # Partition of every key code: keys sorted by row count, largest first,
+    # each going to the partition with the fewest rows so far
+    counts = np.bincount(codes[codes >= 0])
+    loads = np.zeros(partitions, dtype=np.int64)
+    assignment = np.zeros(len(counts), dtype=np.int64)
+    for key in np.argsort(-counts, kind='stable'):
+        target = int(np.argmin(loads))
+        assignment[key] = target
+        loads[target] += counts[key]
+    return assignment
+
+
+def _first_positions(groups):
+    # Index of the first row of every group, for group ids numbered in order
+    # of first appearance (as pd.factorize returns them)
+    new = np.empty(len(groups), dtype=bool)
+    new[:1] = True
+    new[1:] = groups[1:] > np.maximum.accumulate(groups)[:-1]
+    return np.flatnonzero(new)
+
+
+def aggregate_partition(spec, layout, start, stop):
+    # Partial cube cells of the rows order[start:stop], as plain arrays
+    arrays, blocks = attach(spec)
+    try:
+        with span('partition aggregate', 'groupby', rows_in=stop - start) as s:
+            mark = TRACER.mark()
+            positions = arrays['order'][start:stop]
+            key = np.zeros(len(positions), dtype=np.int64)
+            for dimension, size in layout['dimensions']:
+                key = key * size + arrays[f'dim:{dimension}'][positions]
+            groups, keys = pd.factorize(key)
+            cells = len(keys)
+            first = _first_positions(groups)
+
+            out = {
+                'key': keys,
+                'rows': np.bincount(groups, minlength=cells).astype(np.int64),
+                'first_row': positions[first].astype(np.int64),
+            }
+            for measure in layout['measures']:
+                values = arrays[f'measure:{measure}'][positions]
+                valid = ~np.isnan(values)
+                values = np.where(valid, values, 0.0)
+                out[f'{measure}__sum'] = np.bincount(groups, weights=values, minlength=cells)
+                out[f'{measure}__count'] = np.bincount(groups, weights=valid, minlength=cells).astype(np.int64)
+                out[f'{measure}__sumsq'] = np.bincount(groups, weights=values * values, minlength=cells)
+            for column, missing in layout['first']:
+                values = arrays[f'first:{column}'][positions]
+                valid = values != missing if missing is not None else ~pd.isna(values)
+                if valid.all():
+                    out[f'{column}__first'] = values[first]
+                    continue
+                # groupby 'first' skips missing values
+                found, index = np.unique(groups[valid], return_index=True)
+                firsts = np.full(cells, missing if missing is not None else np.nan,
+                                 dtype=values.dtype if missing is not None else np.float64)
+                firsts[found] = values[valid][index]
+                out[f'{column}__first'] = firsts
+            s.rows_out = cells
+            del positions
+        return out, TRACER.since(mark)
+    finally:
+        arrays.clear()
+        for block in blocks:
+            block.close()
+
+
+def build_cube(df, workers=None, partition_by='Product Name', dimensions=CUBE_DIMENSIONS,
+               measures=CUBE_MEASURES, first=('households',)):
+    # SalesCube.build(df, ...) with the rows split over `workers` processes
+    dimensions = list(dimensions)
+    measures = list(measures)
+    first = [c for c in first if c in df.columns]
+    if partition_by not in dimensions:
+        raise ValueError(f"partition_by must be one of the cube dimensions {dimensions}, got '{partition_by}'")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(df) == 0:
+        return SalesCube.build(df, dimensions, measures, first)
+
+    with span('parallel cube build', 'groupby', rows_in=len(df)) as s:
+        columns = {}
+        decoders = {}
+        sizes = []
+        for dimension in dimensions:
+            # Rows with a missing value keep a cell of their own, as in SalesCube.build
+            codes, values, size = encode_key(df[dimension])
+            columns[f'dim:{dimension}'] = codes.astype(np.int64)
+            decoders[dimension] = values
+            sizes.append(size)
+        if np.prod(np.array(sizes, dtype=np.float64)) >= 2.0**62:
+            # Too many combinations for one int64 cell key
+            return SalesCube.build(df, dimensions, measures, first)
+        for measure in measures:
+            columns[f'measure:{measure}'] = df[measure].to_numpy(np.float64)
+        first_layout = []
+        for column in first:
+            values = df[column]
+            if pd.api.types.is_numeric_dtype(values.dtype) and not isinstance(values.dtype, pd.CategoricalDtype):
+                columns[f'first:{column}'] = values.to_numpy()
+                first_layout.append((column, None))
+            else:
+                codes, uniques = encode_column(values)
+                columns[f'first:{column}'] = codes.astype(np.int64)
+                decoders[column] = uniques
+                first_layout.append((column, -1))
+
+        # Row positions grouped by partition; positions stay ascending within
+        # each partition so `first` values resolve as in the serial build
+        partition_codes = columns[f'dim:{partition_by}']
+        workers = min(workers, int(partition_codes.max()) + 1)
+        assignment = assign_partitions(partition_codes, workers)
+        partition = assignment[partition_codes]
+        columns['order'] = np.argsort(partition, kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(partition, minlength=workers))])
+
+        layout = {
+            'dimensions': list(zip(dimensions, sizes)),
+            'measures': measures,
+            'first': first_layout,
+        }
+        with SharedColumns(columns) as shared:
+            del columns
+            spec = shared.spec()
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+                futures = [pool.submit(aggregate_partition, spec, layout, int(bounds[i]), int(bounds[i + 1]))
+                           for i in range(workers) if bounds[i + 1] > bounds[i]]
+                parts = []
+                for future in futures:
+                    part, spans = future.result()
+                    TRACER.extend(spans)
+                    parts.append(part)
+        if not parts:
+            return SalesCube.build(df, dimensions, measures, first)
+
+        # Partitions hold disjoint cells; sorting by the combined key puts them
+        # in groupby order
+        combined = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        order = np.argsort(combined['key'], kind='stable')
+        codes = np.unravel_index(combined['key'][order], sizes)
+        cells = pd.DataFrame({dimension: decode_key(code, decoders[dimension])
+                              for dimension, code in zip(dimensions, codes)})
+        for name, values in combined.items():
+            if name == 'key':
+                continue
+            column = name[:-len('__first')] if name.endswith('__first') else None
+            if column in decoders:
+                values = decode_column(values[order], decoders[column])
+            else:
+                values = values[order]
+            cells[name] = values
+        s.rows_out = len(cells)
+    return SalesCube(cells, dimensions, measures, first, len(df))
+
+
+def main():
+    from synthetic import SyntheticSales
+    import star_schema
+    import compact
+
+    parser = argparse.ArgumentParser(description='Compare the serial and the parallel cube build.')
+    parser.add_argument('--lines', type=int, default=2_000_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--partition-by', choices=PARTITION_DIMENSIONS, default='Product Name')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    frames = SyntheticSales(args.seed).frames(args.lines)
+    schema = star_schema.build_sales_schema(frames)
+    rows = schema.frame(frames['Sales Orders'].columns.tolist() + star_schema.SALES_ATTRIBUTES)
+    rows, _ = compact.compact_fact_table(star_schema.add_derived_columns(rows))
+
+    start = time.perf_counter()
+    expected = SalesCube.build(rows)
+    serial_seconds = time.perf_counter() - start
+
+    print(f"{len(rows)} sales rows, {len(expected)} cells, {os.cpu_count()} CPUs, "
+          f"partitioned by {args.partition_by}:")
+    print(f"  serial         {serial_seconds:8.3f} s")
+    for workers in args.workers:
+        start = time.perf_counter()
+        result = build_cube(rows, workers, args.partition_by)
+        seconds = time.perf_counter() - start
+        try:
+            pd.testing.assert_frame_equal(result.cells, expected.cells, check_exact=False, rtol=1e-9)
+            same = True
+        except AssertionError:
+            same = False
+        print(f"  {workers:2d} workers     {seconds:8.3f} s  x{serial_seconds / seconds:5.2f}  same cells: {same}")
+
+
+if __name__ == '__main__':
+    main()
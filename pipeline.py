@@ -0,0 +1,426 @@
+import argparse
+import ast
+import glob
+import hashlib
+import inspect
+import os
+import pickle
+import time
+
+import arrow_store
+import backends
+import bootstrap
+import budget
+import calendar_dim
+import customers
+import cube
+import export
+import instrument
+import loader
+import metrics
+import seasonality
+import star_schema
+import validate
+from parallel import PARTITION_DIMENSIONS
+
+CACHE_DIR = '.step_cache'
+
+# The analysis as a graph of named tasks:
+#
+#     load -> facts -> cube -> regional, year_region, household,
+#               |               profit_per_sale, channel, product,
+#               |               seasonal -> product_seasonal
+#               +-> orders ---------------> order_value
+#     cube -> budget
+#     facts -> customers, bootstrap
+#     load -> validate
+#
+# eda.py, `python pipeline.py` and query_service.py all run their steps
+# through this graph, with the run settings in SETTINGS (backend, workers,
+# budget phasing, ...), so every front end computes the same tables.
+#
+# Every task output is memoized in CACHE_DIR under a key hashing the task's
+# code, the modules it calls together with every repo module they import,
+# directly or not, the settings it reads and the keys of its inputs (the
+# workbook fingerprint at the root). Asking for a step only runs the tasks
+# whose key changed; an up-to-date output is read back without touching its
+# inputs. `facts` is not pickled: the Arrow fact store is its cache.
+
+TASKS = {}
+
+# Run settings and their defaults; add_setting_arguments() exposes them on a
+# command line
+SETTINGS = {
+    'backend': 'pandas',
+    'workers': 1,
+    'partition_by': 'Product Name',
+    'budget_phasing': 'seasonal',
+    'bootstrap_resamples': bootstrap.RESAMPLES,
+    'bootstrap_normal_rows': None,
+}
+
+
+class Task:
+    # fn is called with the outputs of deps, in order, then the values of
+    # `settings`; a task without deps is called with the workbook path first.
+    # cache=False tasks are recomputed whenever they are needed.
+
+    def __init__(self, name, fn, deps, modules, settings, cache):
+        self.name = name
+        self.fn = fn
+        self.deps = deps
+        self.modules = modules
+        self.settings = settings
+        self.cache = cache
+
+
+def task(name, deps=(), modules=(), settings=(), cache=True):
+    def register(fn):
+        TASKS[name] = Task(name, fn, list(deps), list(modules), list(settings), cache)
+        return fn
+    return register
+
+
+@task('load', modules=[loader, calendar_dim])
+def load(workbook):
+    frames, _ = loader.load_workbook(workbook, loader.workbook_sheets(workbook))
+    return frames
+
+
+@task('validate', deps=['load'], modules=[validate])
+def validation(frames):
+    return validate.validate_workbook(frames).tables()
+
+
+@task('facts', deps=['load'], modules=[arrow_store], settings=['workbook', 'backend'], cache=False)
+def facts(frames, workbook, backend):
+    # Joined, enriched and compacted sales rows from the Arrow fact store,
+    # built with the backend's join when the store is missing or stale:
+    # {'sales', 'unmatched', 'memory_report', 'reused'}
+    tables, reused = arrow_store.fact_rows(workbook, frames, backend=backend)
+    return dict(tables, reused=reused)
+
+
+@task('cube', deps=['facts'], modules=[backends], settings=['backend', 'workers', 'partition_by'])
+def build_cube(fact_tables, backend, workers, partition_by):
+    return backends.get_backend(backend, workers or None, partition_by).cube(fact_tables['sales'])
+
+
+@task('orders', deps=['facts'], modules=[backends], settings=['backend'])
+def orders(fact_tables, backend):
+    return backends.get_backend(backend).orders_by_region(fact_tables['sales'])
+
+
+@task('regional', deps=['cube'], modules=[metrics, cube])
+def regional(sales_cube):
+    return metrics.regional_sales_tables(sales_cube)
+
+
+@task('year_region', deps=['cube'], modules=[metrics, cube])
+def year_region(sales_cube):
+    return metrics.year_region_tables(sales_cube)
+
+
+@task('household', deps=['cube'], modules=[metrics, cube])
+def household(sales_cube):
+    return metrics.household_tables(sales_cube)
+
+
+@task('profit_per_sale', deps=['cube'], modules=[metrics, cube])
+def profit_per_sale(sales_cube):
+    return metrics.profit_per_sale_tables(sales_cube)
+
+
+@task('channel', deps=['cube'], modules=[metrics, cube])
+def channel(sales_cube):
+    return metrics.channel_tables(sales_cube)
+
+
+@task('product', deps=['cube'], modules=[metrics, cube])
+def product(sales_cube):
+    return metrics.product_tables(sales_cube)
+
+
+@task('seasonal', deps=['cube'], modules=[metrics, cube])
+def seasonal(sales_cube):
+    return metrics.seasonal_tables(sales_cube)
+
+
+@task('product_seasonal', deps=['cube', 'product'], modules=[metrics, cube, seasonality])
+def product_seasonal(sales_cube, product_metrics):
+    return metrics.product_seasonal_tables(sales_cube, product_metrics['top_products'])
+
+
+@task('order_value', deps=['cube', 'orders'], modules=[metrics, cube])
+def order_value(sales_cube, orders_by_region):
+    return metrics.order_value_tables(sales_cube, orders_by_region)
+
+
+@task('budget', deps=['cube', 'load'], modules=[budget, cube], settings=['budget_phasing'])
+def budget_vs_actual(sales_cube, frames, budget_phasing):
+    return budget.budget_tables(sales_cube, frames, budget_phasing)
+
+
+@task('customers', deps=['facts', 'load'], modules=[customers, star_schema])
+def customer_segments(fact_tables, frames):
+    return customers.customer_tables(fact_tables['sales'], frames['Customers'])
+
+
+@task('bootstrap', deps=['facts'], modules=[bootstrap], settings=['bootstrap_resamples', 'bootstrap_normal_rows', 'workers'])
+def bootstrap_intervals(fact_tables, bootstrap_resamples, bootstrap_normal_rows, workers):
+    tables, _ = bootstrap.bootstrap_tables(fact_tables['sales'], bootstrap_resamples, workers=workers or None,
+                                           normal_rows=bootstrap_normal_rows)
+    return tables
+
+
+# The analysis steps selectable with --steps, in eda.py order
+STEPS = ['validate', 'regional', 'year_region', 'household', 'profit_per_sale', 'bootstrap', 'channel',
+         'product', 'seasonal', 'product_seasonal', 'order_value', 'budget', 'customers']
+
+
+def chart_tables(step, tables):
+    # {chart name: tables} for the charts.py chart drawn from a step, if any
+    if step == 'regional':
+        return {'regional_sales': {'sales_by_geographic_region': tables['sales_by_geographic_region']}}
+    if step == 'household':
+        return {'household_metrics': {'region_metrics': tables['region_metrics']}}
+    if step == 'profit_per_sale':
+        return {'profit_per_sale': {'profit_per_sale': tables['profit_per_sale']}}
+    if step == 'channel':
+        names = ['channel_by_region', 'channel_percentages', 'profit_by_channel']
+        return {'channel_analysis': {name: tables[name] for name in names}}
+    if step == 'product':
+        names = ['top_products', 'top_products_profit', 'top_margin_products', 'product_region_sales',
+                 'product_frequency', 'avg_sale_by_product']
+        return {'product_analysis': {name: tables[name] for name in names}}
+    if step == 'seasonal':
+        return {'seasonal_analysis': dict(tables)}
+    if step == 'product_seasonal':
+        # The correlation matrix is indexed by the top 5 products, in sales order
+        top_5_products = tables['correlation_matrix'].index
+        seasonality_top = tables['product_seasonality'].loc[top_5_products]
+        return {'product_seasonal_analysis': {
+            'top_product_month': tables['product_month'].loc[top_5_products],
+            'quarterly_products': tables['quarterly_products'],
+            'product_seasonal_variance': seasonality_top['Seasonal_Variance_%'].to_dict(),
+            'peak_months_by_product': seasonality_top['Peak_Month'].to_dict(),
+            'correlation_matrix': tables['correlation_matrix'],
+        }}
+    if step == 'order_value':
+        return {'order_value_analysis': {'household_order_metrics': tables['household_order_metrics']}}
+    return {}
+
+
+_source_hashes = {}
+_imports = {}
+
+
+def _source_hash(path):
+    if path not in _source_hashes:
+        with open(path, 'rb') as f:
+            _source_hashes[path] = hashlib.sha256(f.read()).hexdigest()
+    return _source_hashes[path]
+
+
+def _repo_imports(path):
+    # Paths of the modules next to `path` that it imports, at module level or
+    # in any function but main() (whose imports only serve the command line)
+    if path not in _imports:
+        with open(path, 'rb') as f:
+            tree = ast.parse(f.read(), path)
+        nodes = list(tree.body)
+        names = set()
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, ast.FunctionDef) and node.name == 'main':
+                continue
+            if isinstance(node, ast.Import):
+                names.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                names.add(node.module)
+            nodes.extend(ast.iter_child_nodes(node))
+        directory = os.path.dirname(path)
+        candidates = (os.path.join(directory, name.split('.')[0] + '.py') for name in names)
+        _imports[path] = sorted(p for p in candidates if os.path.exists(p))
+    return _imports[path]
+
+
+def module_closure(modules):
+    # Source paths of `modules` and of every repo module they import, directly or not
+    seen = set()
+    pending = [os.path.abspath(module.__file__) for module in modules]
+    while pending:
+        path = pending.pop()
+        if path not in seen:
+            seen.add(path)
+            pending.extend(_repo_imports(path))
+    return sorted(seen)
+
+
+def add_setting_arguments(parser):
+    # The SETTINGS options, shared by every front end of the task graph
+    parser.add_argument('--backend', choices=backends.BACKENDS, default=SETTINGS['backend'],
+                        help='engine for the joins and groupbys of Steps 1-12 (duckdb and polars are optional)')
+    parser.add_argument('--workers', type=int, default=SETTINGS['workers'],
+                        help='build the aggregate cube and the bootstrap on this many processes (0: one per CPU)')
+    parser.add_argument('--partition-by', choices=PARTITION_DIMENSIONS, default=SETTINGS['partition_by'],
+                        help='how the sales rows are split between the --workers processes')
+    parser.add_argument('--budget-phasing', choices=budget.PHASINGS, default=SETTINGS['budget_phasing'],
+                        help="how Step 13 spreads annual budgets over months: 'even', or 'seasonal' "
+                             "to follow each product's monthly sales in the year before")
+    parser.add_argument('--bootstrap-resamples', type=int, default=SETTINGS['bootstrap_resamples'],
+                        help='resamples behind the 95%% intervals of Steps 7 and 8 and the bootstrap_product table')
+    parser.add_argument('--bootstrap-normal-rows', type=int, default=SETTINGS['bootstrap_normal_rows'],
+                        help='draw the intervals of groups with more sales lines than this from the normal limit '
+                             'instead of resampling them (faster, approximate; default: resample every group)')
+
+
+def settings_from_args(parser, args):
+    if args.bootstrap_resamples < 1:
+        parser.error('--bootstrap-resamples must be at least 1')
+    if args.bootstrap_normal_rows is not None and args.bootstrap_normal_rows < 1:
+        parser.error('--bootstrap-normal-rows must be at least 1')
+    return {name: getattr(args, name) for name in SETTINGS}
+
+
+class Pipeline:
+    # Runs tasks of TASKS for one workbook, memoizing outputs in cache_dir.
+    # `settings` override SETTINGS. `status` records for every task touched
+    # whether it was 'computed' or read back from the cache ('cached'), and
+    # how long that took.
+
+    def __init__(self, workbook, cache_dir=CACHE_DIR, use_cache=True, settings=None):
+        self.workbook = workbook
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self.settings = dict(SETTINGS, **(settings or {}), workbook=workbook)
+        self.keys = {}
+        self.values = {}
+        self.status = {}
+
+    def key(self, name):
+        # Changes whenever the task's code or anything upstream of it changes
+        if name not in self.keys:
+            t = TASKS[name]
+            digest = hashlib.sha256(name.encode())
+            digest.update(inspect.getsource(t.fn).encode())
+            for path in module_closure(t.modules):
+                digest.update(_source_hash(path).encode())
+            for setting in t.settings:
+                digest.update(f'{setting}={self.settings[setting]!r}'.encode())
+            if t.deps:
+                for dep in t.deps:
+                    digest.update(self.key(dep).encode())
+            else:
+                digest.update(loader.workbook_fingerprint(self.workbook)['key'].encode())
+            self.keys[name] = digest.hexdigest()[:16]
+        return self.keys[name]
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, f'{name}-{self.key(name)}.pkl')
+
+    def _store(self, name, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(name)
+        # Only the latest output of each task is kept
+        for stale in glob.glob(os.path.join(self.cache_dir, f'{name}-*.pkl')):
+            if stale != path:
+                os.remove(stale)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def get(self, name):
+        if name in self.values:
+            return self.values[name]
+        start = time.perf_counter()
+        t = TASKS[name]
+        path = self._path(name)
+        if t.cache and self.use_cache and os.path.exists(path):
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            source = 'cached'
+        else:
+            inputs = [self.get(dep) for dep in t.deps] if t.deps else [self.workbook]
+            inputs += [self.settings[setting] for setting in t.settings]
+            start = time.perf_counter()
+            with instrument.span(f'task {name}', 'task'):
+                value = t.fn(*inputs)
+            if t.cache:
+                self._store(name, value)
+            source = 'computed'
+        self.status[name] = {'source': source, 'seconds': time.perf_counter() - start}
+        self.values[name] = value
+        return value
+
+    def run(self, names):
+        return {name: self.get(name) for name in names}
+
+
+def parse_steps(text):
+    if not text or text == 'all':
+        return list(STEPS)
+    steps = [step.strip() for step in text.split(',') if step.strip()]
+    unknown = [step for step in steps if step not in STEPS]
+    if unknown:
+        raise ValueError(f"Unknown steps {unknown}, choose from {STEPS}")
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run selected analysis steps, reusing memoized upstream work.')
+    parser.add_argument('--workbook', default='Regional Sales Dataset.xlsx')
+    parser.add_argument('--steps', default='all', help=f"comma-separated subset of: {','.join(STEPS)}")
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--force', action='store_true', help='recompute every task the steps need')
+    parser.add_argument('--no-charts', action='store_true', help='skip the charts (matplotlib is never imported)')
+    parser.add_argument('--tables-dir', help='write the steps\' tables to this directory')
+    parser.add_argument('--tables-format', choices=export.TABLE_FORMATS, default='csv')
+    parser.add_argument('--trace', help='write a JSON or CSV trace of the run (by extension)')
+    parser.add_argument('--chrome-trace', help='write a Chrome trace (chrome://tracing, Perfetto)')
+    parser.add_argument('--trace-memory', action='store_true', help='also trace peak memory (slower)')
+    add_setting_arguments(parser)
+    args = parser.parse_args()
+    settings = settings_from_args(parser, args)
+    if args.trace or args.chrome_trace:
+        instrument.TRACER.enable(memory=args.trace_memory)
+
+    try:
+        steps = parse_steps(args.steps)
+    except ValueError as e:
+        parser.error(str(e))
+
+    pipeline = Pipeline(args.workbook, args.cache_dir, use_cache=not args.force, settings=settings)
+    results = pipeline.run(steps)
+    for step, tables in results.items():
+        print(f"\n=== {step} ===")
+        for name, table in tables.items():
+            print(f"\n{name}:")
+            print(table)
+
+    if args.tables_dir:
+        tables = {name: table for step_tables in results.values() for name, table in step_tables.items()}
+        written = export.write_tables(tables, args.tables_dir, args.tables_format)
+        print(f"\n{len(written)} tables written to {args.tables_dir}/ as {args.tables_format}")
+
+    if not args.no_charts:
+        # Imported here so a tables-only run never loads matplotlib
+        from charts import render_charts
+        charts = {}
+        for step, tables in results.items():
+            charts.update(chart_tables(step, tables))
+        for chart_name, result in render_charts(charts).items():
+            print(f"📊 {chart_name}: {result['status']} '{result['path']}'")
+
+    print("\nTasks:")
+    for name, status in pipeline.status.items():
+        print(f"  {name}: {status['seconds']:.3f}s ({status['source']})")
+
+    if args.trace:
+        print(f"Trace written to {instrument.TRACER.write(args.trace)}")
+    if args.chrome_trace:
+        print(f"Chrome trace written to {instrument.TRACER.write_chrome(args.chrome_trace)}")
+
+
+if __name__ == '__main__':
+    main()
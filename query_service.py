@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from export import table_frame
+from pipeline import CACHE_DIR, STEPS, Pipeline, add_setting_arguments, settings_from_args
+
+# A local HTTP/JSON service over the metrics tables of every analysis step
+# (region_metrics, profit_per_sale, channel_by_region, monthly_sales, ...).
+# The tables are computed once through the step pipeline, so a restart reads
+# them back from .step_cache/, and then served from memory:
+#
+#     GET /tables                          table names, rows and columns
+#     GET /tables/<name>                   every row, as JSON records
+#     GET /tables/<name>?Region=West       rows where Region is West
+#         &Channel=Wholesale,Export        ... and Channel is either value
+#         &columns=Region,Profit           only these columns
+#         &sort=-Profit&limit=5            sorted descending, first 5 rows
+#     GET /status                          data version, load time, cache stats
+#
+# Encoded responses are kept in an LRU cache keyed by the data version and
+# the request, so a repeated query is a dictionary lookup. A watcher thread
+# checks the workbook's size and mtime every few seconds; when it changes the
+# tables are recomputed in the background (only stale tasks run) and swapped
+# in, and the cache starts over. Requests are served by one thread each.
+
+DEFAULT_PORT = 8765
+CACHE_SIZE = 1024
+RELOAD_CHECK_SECONDS = 2.0
+
+
+class QueryError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class LRUCache:
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+def _source_stamp(workbook):
+    st = os.stat(workbook)
+    return st.st_size, st.st_mtime_ns
+
+
+class MetricsStore:
+    # The flattened tables of every step for one workbook, replaced as a whole
+    # on reload; readers always see one consistent (version, tables) pair.
+    # `settings` are the pipeline.SETTINGS overrides eda.py was run with.
+
+    def __init__(self, workbook, cache_dir=CACHE_DIR, cache_size=CACHE_SIZE, settings=None):
+        self.workbook = workbook
+        self.cache_dir = cache_dir
+        self.settings = settings
+        self.cache = LRUCache(cache_size)
+        self.state = None
+        self.loaded_at = None
+        self.load_seconds = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.load()
+
+    def load(self):
+        with self._reload_lock:
+            stamp = _source_stamp(self.workbook)
+            start = time.perf_counter()
+            results = Pipeline(self.workbook, self.cache_dir, settings=self.settings).run(STEPS)
+            tables = {name: table_frame(table) for step_tables in results.values()
+                      for name, table in step_tables.items()}
+            version = self.state[0] + 1 if self.state else 1
+            self.state = (version, tables, stamp)
+            self.load_seconds = time.perf_counter() - start
+            self.loaded_at = time.time()
+            self.cache.clear()
+        return version
+
+    def reload_if_changed(self):
+        try:
+            changed = _source_stamp(self.workbook) != self.state[2]
+        except OSError:
+            return False   # mid-replace; try again on the next check
+        if changed:
+            self.load()
+        return changed
+
+    def watch(self, interval=RELOAD_CHECK_SECONDS):
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.reload_if_changed()
+                except Exception as e:   # keep serving the old tables
+                    print(f"Reload failed: {e}")
+        thread = threading.Thread(target=run, name='metrics-reload', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def query(self, path, params):
+        # (encoded JSON, served from cache?) for a request path and its
+        # parsed query string
+        version, tables, _ = self.state
+        if path.strip('/') == 'status':
+            # Live figures, never cached
+            return json.dumps(self._answer(tables, version, path, params), default=str).encode(), False
+        key = (version, path, tuple(sorted((k, tuple(v)) for k, v in params.items())))
+        body = self.cache.get(key)
+        if body is not None:
+            return body, True
+        body = json.dumps(self._answer(tables, version, path, params), default=str).encode()
+        self.cache.put(key, body)
+        return body, False
+
+    def _answer(self, tables, version, path, params):
+        parts = [p for p in path.split('/') if p]
+        if parts == ['status']:
+            return {'version': version, 'workbook': self.workbook, 'loaded_at': self.loaded_at,
+                    'load_seconds': self.load_seconds, 'tables': len(tables),
+                    'cache': {'entries': len(self.cache), 'hits': self.cache.hits, 'misses': self.cache.misses}}
+        if parts == ['tables']:
+            return {name: {'rows': len(frame), 'columns': list(frame.columns)} for name, frame in tables.items()}
+        if len(parts) == 2 and parts[0] == 'tables':
+            if parts[1] not in tables:
+                raise QueryError(404, f"Unknown table '{parts[1]}'")
+            return {'table': parts[1], 'version': version, 'rows': _select(tables[parts[1]], params)}
+        raise QueryError(404, f"Unknown path '{path}'")
+
+
+def _select(frame, params):
+    # Filter, project, sort and limit a flat table; returns JSON records
+    params = dict(params)
+    columns = params.pop('columns', None)
+    sort = params.pop('sort', None)
+    limit = params.pop('limit', None)
+    for column, values in params.items():
+        if column not in frame.columns:
+            raise QueryError(400, f"Unknown column '{column}', expected one of {list(frame.columns)}")
+        allowed = {value for v in values for value in v.split(',')}
+        frame = frame[frame[column].astype(str).isin(allowed)]
+    if sort:
+        key = sort[-1]
+        column = key.lstrip('-')
+        if column not in frame.columns:
+            raise QueryError(400, f"Unknown sort column '{column}'")
+        frame = frame.sort_values(column, ascending=not key.startswith('-'))
+    if columns:
+        names = [c for v in columns for c in v.split(',')]
+        unknown = [c for c in names if c not in frame.columns]
+        if unknown:
+            raise QueryError(400, f"Unknown columns {unknown}")
+        frame = frame[names]
+    if limit:
+        try:
+            frame = frame.head(int(limit[-1]))
+        except ValueError:
+            raise QueryError(400, f"limit must be an integer, got '{limit[-1]}'")
+    return json.loads(frame.to_json(orient='records', date_format='iso'))
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    store = None
+    verbose = False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        try:
+            body, cached = self.store.query(url.path, parse_qs(url.query))
+            status = 200
+        except QueryError as e:
+            body, cached, status = json.dumps({'error': str(e)}).encode(), False, e.status
+        except Exception as e:
+            # Any other failure is answered in JSON too, and its traceback
+            # goes to stderr whether or not --verbose is set
+            traceback.print_exc()
+            body, cached, status = json.dumps({'error': f'{type(e).__name__}: {e}'}).encode(), False, 500
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Cache', 'hit' if cached else 'miss')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(store, host='127.0.0.1', port=DEFAULT_PORT, verbose=False):
+    handler = type('Handler', (QueryHandler,), {'store': store, 'verbose': verbose})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the metrics tables as a local JSON query API.')
+    parser.add_argument('--workbook', default='Regional Sales Dataset.xlsx')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help='cached responses kept')
+    parser.add_argument('--reload-every', type=float, default=RELOAD_CHECK_SECONDS,
+                        help='seconds between checks of the workbook for changes')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    add_setting_arguments(parser)
+    args = parser.parse_args()
+    settings = settings_from_args(parser, args)
+
+    store = MetricsStore(args.workbook, args.cache_dir, args.cache_size, settings)
+    store.watch(args.reload_every)
+    server = make_server(store, args.host, args.port, args.verbose)
+    print(f"Serving {len(store.state[1])} tables from '{args.workbook}' "
+          f"(loaded in {store.load_seconds:.2f}s) on http://{args.host}:{args.port}/tables")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.stop()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
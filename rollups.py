@@ -0,0 +1,321 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from instrument import span
+
+# Time rollups of the sales rows for date-range queries. For every grain
+# (day, week, month, quarter) the revenue, cost, profit and line counts of
+# each Region x Channel x Product combination are summed per period and
+# stored as running totals, kept only for the (combination, period) pairs
+# that have sales and sorted by combination, then period:
+#
+#     cum[e] = measures of all entries before entry e
+#
+# A combination's entries are contiguous, so its total over any range of
+# periods is cum[hi] - cum[lo], with lo and hi found by binary search on the
+# entry keys (combination * periods + period). A dimension slice or grouping
+# only sums over the combinations (a few hundred), never over sales rows, and
+# the memory grows with the entries instead of periods x combinations.
+#
+# Orders are distinct order numbers. An order has one date, channel and
+# delivery region but may have several products, so per-product counts
+# cannot be added up: totals not split by product come from running totals
+# of a Region x Channel order table, and slices by product count the
+# distinct orders of the (day, combination, order) lines in the date range.
+# (An order whose lines do span regions, channels or dates counts once in
+# each.) That exact path is the one part of a query that is not a binary
+# search plus a small sum: it costs O(order lines in the range), and the
+# order lines take about as much memory as the (distinct) sales lines.
+# Mergeable HyperLogLog sketches per (day, combination) would avoid the scan,
+# but at m one-byte registers per sketch they would be larger than the lines
+# they replace, and per (day, product) sketches could not honour Region or
+# Channel slices, so exact counts are kept.
+#
+# Rows without an OrderDate belong to no period and are left out
+# (undated_rows counts them). Missing dimension values get a label of their
+# own, so totals not grouped by that dimension still include their rows.
+
+ROLLUP_DIMENSIONS = ['Region', 'Channel', 'Product Name']
+ROLLUP_MEASURES = ['Line Total', 'Total Unit Cost', 'Profit']
+ORDER_DIMENSIONS = ['Region', 'Channel']
+GRAINS = ['day', 'week', 'month', 'quarter']
+COUNTS = {'Lines': np.int64, 'Orders': np.int64}
+
+
+def _encode(column):
+    # Integer codes in sorted order and the labels they stand for; missing
+    # values get the last code, labelled NaN
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes, labels = column.cat.codes.to_numpy().astype(np.int64), column.cat.categories
+    else:
+        codes, labels = pd.factorize(column, sort=True)
+        codes = codes.astype(np.int64)
+    return np.where(codes < 0, len(labels), codes), labels.insert(len(labels), np.nan)
+
+
+def day_numbers(dates):
+    # Day number (since 1970-01-01) of every date
+    return np.asarray(dates).astype('datetime64[D]').astype(np.int64)
+
+
+def period_of(days, grain):
+    # Day number of the start of the period of `grain` holding each day
+    if grain == 'day':
+        return days
+    if grain == 'week':
+        # Weeks start on Monday; day 0 was a Thursday
+        return days - (days + 3) % 7
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    if grain == 'quarter':
+        months = months - months % 3
+    return months.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+
+
+def _to_day(value):
+    return pd.Timestamp(value).to_datetime64().astype('datetime64[D]').astype(np.int64)
+
+
+class RunningTotals:
+    # Running totals of per-(combination, period) sums, for the pairs with
+    # rows only: `keys` (combination * periods + period) sorted, and cum with
+    # one more row than keys (cum[0] is zero)
+
+    def __init__(self, keys, sums, periods):
+        self.keys = keys
+        self.periods = periods
+        self.cum = np.zeros((len(keys) + 1, sums.shape[1]))
+        np.cumsum(sums, axis=0, out=self.cum[1:])
+
+    def totals(self, i, j, combinations):
+        # Sums of every combination over the periods [i, j)
+        base = combinations.astype(np.int64) * self.periods
+        return self.cum[np.searchsorted(self.keys, base + j)] - self.cum[np.searchsorted(self.keys, base + i)]
+
+    def entries(self, i, j):
+        # (period, combination, sums) of the entries in the periods [i, j)
+        period = self.keys % self.periods
+        inside = np.flatnonzero((period >= i) & (period < j))
+        return period[inside], self.keys[inside] // self.periods, self.cum[inside + 1] - self.cum[inside]
+
+
+class Rollup:
+    # Running totals of one grain: `periods` are the sorted period start days
+
+    def __init__(self, grain, periods, totals, orders):
+        self.grain = grain
+        self.periods = periods
+        self.totals = totals    # RunningTotals of the cells: ROLLUP_MEASURES and Lines
+        self.orders = orders    # RunningTotals of the order cells: Orders
+
+    def bounds(self, start=None, end=None):
+        # [i, j) of the periods starting within [start, end] (dates, inclusive)
+        i = 0 if start is None else int(np.searchsorted(self.periods, _to_day(start), 'left'))
+        j = len(self.periods) if end is None else int(np.searchsorted(self.periods, _to_day(end), 'right'))
+        return i, max(i, j)
+
+    def days(self, i, j):
+        # [first, last) day numbers of the periods [i, j)
+        first = self.periods[i] if i < len(self.periods) else np.iinfo(np.int64).max
+        last = self.periods[j] if j < len(self.periods) else np.iinfo(np.int64).max
+        return first, last
+
+    def labels(self, i, j):
+        return pd.DatetimeIndex(self.periods[i:j].astype('datetime64[D]'), name='Period')
+
+
+class TimeRollups:
+    # Rollups of every grain over the same Region x Channel x Product cells
+
+    def __init__(self, cells, order_cells, rollups, order_lines, undated_rows=0):
+        self.cells = cells                # one row per combination: its dimension labels
+        self.order_cells = order_cells    # the same for ORDER_DIMENSIONS
+        self.rollups = rollups            # {grain: Rollup}
+        self.order_lines = order_lines    # (day, combination, order code) lines, sorted by day
+        self.undated_rows = undated_rows  # rows left out for a missing OrderDate
+        self.measures = ROLLUP_MEASURES + ['Lines', 'Orders']
+
+    @classmethod
+    def build(cls, rows, grains=GRAINS):
+        with span('time rollups', 'groupby', rows_in=len(rows)) as s:
+            dated = rows['OrderDate'].notna().to_numpy()
+            undated_rows = int(np.count_nonzero(~dated))
+            rows = rows[dated]
+            codes = {}
+            labels = {}
+            for dimension in ROLLUP_DIMENSIONS:
+                codes[dimension], labels[dimension] = _encode(rows[dimension])
+            cells, combination = cls._combinations(codes, labels, ROLLUP_DIMENSIONS)
+            order_cells, order_combination = cls._combinations(codes, labels, ORDER_DIMENSIONS)
+            order_codes = pd.factorize(rows['OrderNumber'])[0]
+            has_order = order_codes >= 0
+            orders = int(order_codes.max()) + 1 if has_order.any() else 1
+            days = day_numbers(rows['OrderDate'])
+
+            values = [rows[m].to_numpy(np.float64) for m in ROLLUP_MEASURES]
+            values = [np.where(np.isnan(v), 0.0, v) for v in values]
+            values.append(np.ones(len(rows)))
+            rollups = {}
+            for grain in grains:
+                periods, period = np.unique(period_of(days, grain), return_inverse=True)
+                keys, entry = np.unique(combination * len(periods) + period, return_inverse=True)
+                sums = np.stack([np.bincount(entry, weights=v, minlength=len(keys)) for v in values], axis=-1)
+                order_key = (order_combination * len(periods) + period)[has_order]
+                distinct = pd.unique(order_key * orders + order_codes[has_order]) // orders
+                order_keys, order_sums = np.unique(distinct, return_counts=True)
+                rollups[grain] = Rollup(grain, periods, RunningTotals(keys, sums, len(periods)),
+                                        RunningTotals(order_keys, order_sums[:, np.newaxis], len(periods)))
+
+            lines = pd.DataFrame({
+                'day': days.astype(np.int32),
+                'combination': combination.astype(np.int32),
+                'order': order_codes.astype(np.int32),
+            })[has_order].drop_duplicates().sort_values('day', kind='stable')
+            order_lines = tuple(lines[c].to_numpy() for c in lines.columns)
+            s.rows_out = sum(len(r.totals.keys) for r in rollups.values())
+        return cls(cells, order_cells, rollups, order_lines, undated_rows)
+
+    @staticmethod
+    def _combinations(codes, labels, dimensions):
+        # (labels of every combination present, in sorted order; combination of every row)
+        key = np.zeros(len(codes[dimensions[0]]), dtype=np.int64)
+        sizes = [len(labels[d]) for d in dimensions]
+        for dimension, size in zip(dimensions, sizes):
+            key = key * size + codes[dimension]
+        present, combination = np.unique(key, return_inverse=True)
+        parts = np.unravel_index(present, sizes)
+        cells = pd.DataFrame({d: labels[d].take(part) for d, part in zip(dimensions, parts)})
+        return cells, combination
+
+    def _select(self, cells, by, where):
+        # (mask of the combinations passing `where` and with all of `by`,
+        # group of every selected combination, labels of the groups)
+        mask = np.ones(len(cells), dtype=bool)
+        for dimension, allowed in (where or {}).items():
+            if dimension not in cells.columns:
+                raise KeyError(f"'{dimension}' is not a rollup dimension {ROLLUP_DIMENSIONS}")
+            allowed = [allowed] if isinstance(allowed, str) else list(allowed)
+            mask &= cells[dimension].isin(allowed).to_numpy()
+        if not by:
+            return mask, np.zeros(np.count_nonzero(mask), dtype=np.int64), None
+        mask &= cells[by].notna().all(axis=1).to_numpy()
+        selected = cells[mask]
+        groups = selected.groupby(by, sort=True, observed=True).ngroup().to_numpy()
+        keys = selected[by].drop_duplicates().sort_values(by)
+        index = pd.MultiIndex.from_frame(keys) if len(by) > 1 else pd.Index(keys[by[0]], name=by[0])
+        return mask, groups, index
+
+    @staticmethod
+    def _group_of(mask, groups):
+        group_of = np.full(len(mask), -1, dtype=np.int64)
+        group_of[mask] = groups
+        return group_of
+
+    def _group(self, totals, i, j, mask, groups, count, per_period):
+        # (periods, groups, measures) sums of the selected combinations
+        if per_period:
+            period, combination, values = totals.entries(i, j)
+            group = self._group_of(mask, groups)[combination]
+            keep = group >= 0
+            cell = (period[keep] - i) * count + group[keep]
+            values = values[keep]
+        else:
+            cell = groups
+            values = totals.totals(i, j, np.flatnonzero(mask))
+        periods = j - i if per_period else 1
+        sums = [np.bincount(cell, weights=values[:, m], minlength=periods * count) for m in range(values.shape[1])]
+        return np.stack(sums, axis=-1).reshape(periods, count, values.shape[1])
+
+    def _product_orders(self, rollup, i, j, mask, groups, count, per_period):
+        # (periods, groups) distinct orders of the order lines in the periods
+        # [i, j), for slices by product; O(order lines in the range)
+        days, combination, orders = self.order_lines
+        first, last = rollup.days(i, j)
+        lo, hi = np.searchsorted(days, first), np.searchsorted(days, last)
+        group = self._group_of(mask, groups)[combination[lo:hi]]
+        keep = group >= 0
+        cell = group[keep]
+        if per_period:
+            period = np.searchsorted(rollup.periods, period_of(days[lo:hi][keep].astype(np.int64), rollup.grain))
+            cell = (period - i) * count + cell
+        size = int(orders.max()) + 1 if len(orders) else 1
+        distinct = pd.unique(cell * size + orders[lo:hi][keep]) // size
+        periods = j - i if per_period else 1
+        return np.bincount(distinct, minlength=periods * count).reshape(periods, count)
+
+    def _aggregate(self, rollup, i, j, by, where, per_period):
+        by = [by] if isinstance(by, str) else list(by or [])
+        for dimension in by:
+            if dimension not in ROLLUP_DIMENSIONS:
+                raise KeyError(f"'{dimension}' is not a rollup dimension {ROLLUP_DIMENSIONS}")
+        mask, groups, index = self._select(self.cells, by, where)
+        count = len(index) if index is not None else 1
+        totals = self._group(rollup.totals, i, j, mask, groups, count, per_period)
+
+        if 'Product Name' in by or 'Product Name' in (where or {}):
+            orders = self._product_orders(rollup, i, j, mask, groups, count, per_period)
+        else:
+            order_mask, order_groups, _ = self._select(self.order_cells, by, where)
+            orders = self._group(rollup.orders, i, j, order_mask, order_groups, count, per_period)[..., 0]
+        return np.concatenate([totals, orders[..., np.newaxis]], axis=-1), index
+
+    def query(self, start=None, end=None, by=(), where=None, grain='day'):
+        # Totals over the periods of `grain` starting within [start, end]:
+        # a DataFrame indexed by `by`, or a Series without `by`. `where` maps
+        # dimensions to the values kept, e.g. {'Channel': ['Wholesale']}.
+        rollup = self.rollups[grain]
+        i, j = rollup.bounds(start, end)
+        totals, index = self._aggregate(rollup, i, j, by, where, per_period=False)
+        if index is None:
+            return pd.Series(totals[0, 0], index=self.measures)
+        return pd.DataFrame(totals[0], index=index, columns=self.measures).astype(COUNTS)
+
+    def series(self, grain, start=None, end=None, by=(), where=None):
+        # One row per period (and group of `by`) within [start, end]
+        rollup = self.rollups[grain]
+        i, j = rollup.bounds(start, end)
+        totals, index = self._aggregate(rollup, i, j, by, where, per_period=True)
+        periods = rollup.labels(i, j)
+        if index is None:
+            return pd.DataFrame(totals[:, 0], index=periods, columns=self.measures).astype(COUNTS)
+        frame = pd.DataFrame(totals.reshape(-1, len(self.measures)), columns=self.measures)
+        frame.index = pd.MultiIndex.from_product([periods, index], names=['Period'] + list(index.names))
+        return frame.astype(COUNTS)
+
+
+def parse_where(items):
+    # ['Channel=Wholesale,Export', 'Region=West'] -> {dimension: [values]}
+    where = {}
+    for item in items or []:
+        dimension, _, values = item.partition('=')
+        where[dimension] = values.split(',')
+    return where
+
+
+def main():
+    from arrow_store import fact_rows
+
+    parser = argparse.ArgumentParser(description='Answer date-range sales queries from pre-aggregated rollups.')
+    parser.add_argument('--workbook', default='Regional Sales Dataset.xlsx')
+    parser.add_argument('--start', help='first date, e.g. 2017-07-01')
+    parser.add_argument('--end', help='last date, e.g. 2017-09-30')
+    parser.add_argument('--by', default='', help=f"comma-separated subset of: {','.join(ROLLUP_DIMENSIONS)}")
+    parser.add_argument('--where', action='append', help="keep only these values, e.g. 'Channel=Wholesale,Export'")
+    parser.add_argument('--grain', choices=GRAINS, help='one row per period of this grain instead of totals')
+    args = parser.parse_args()
+
+    tables, _ = fact_rows(args.workbook)
+    rollups = TimeRollups.build(tables['sales'])
+    if rollups.undated_rows:
+        print(f"{rollups.undated_rows} rows without an OrderDate left out")
+    by = [d.strip() for d in args.by.split(',') if d.strip()]
+    where = parse_where(args.where)
+    if args.grain:
+        print(rollups.series(args.grain, args.start, args.end, by, where).round(2))
+    else:
+        print(rollups.query(args.start, args.end, by, where).round(2))
+
+
+if __name__ == '__main__':
+    main()
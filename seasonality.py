@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+from cube import MONTH_NAMES
+
+
+def product_month_matrix(cube, measure='Line Total', product='Product Name'):
+    # Products x months (January..December) matrix of summed sales, rolled up
+    # from the aggregate cube in one go. Months in which a product did not
+    # sell at all are NaN, like the per-product groupby in Step 11 was.
+    totals = cube.sum([product, 'Month'], measure).unstack('Month')
+    totals = totals.reindex(columns=range(1, 13))
+    totals.columns = pd.Index(MONTH_NAMES, name='Month_Name')
+    return totals
+
+
+def seasonal_variance(matrix):
+    # Spread between the best and worst selling month, in % of the worst
+    low = matrix.min(axis=1)
+    return (matrix.max(axis=1) - low) / low * 100
+
+
+def peak_month(matrix):
+    values = matrix.to_numpy(np.float64)
+    best = np.argmax(np.where(np.isnan(values), -np.inf, values), axis=1)
+    return pd.Series(matrix.columns.to_numpy()[best], index=matrix.index, name='Peak_Month')
+
+
+def seasonality_summary(matrix):
+    # Seasonal variance, peak month and total for every product in the matrix
+    return pd.DataFrame({
+        'Seasonal_Variance_%': seasonal_variance(matrix),
+        'Peak_Month': peak_month(matrix),
+        'Total': matrix.sum(axis=1),
+    })
+
+
+def seasonality_correlation(matrix, products=None, block_size=1024, dtype=np.float64, out=None):
+    # Pearson correlation of the monthly sales profiles of every pair of
+    # products, over the months in which both sold (NaN months are left out
+    # pairwise, as DataFrame.corr does). The sums behind each pair's
+    # correlation are matrix products of the profiles and their valid-month
+    # masks, filled in block_size x block_size tiles, so the working set stays
+    # small for catalogues of thousands of products; pass a np.memmap as `out`
+    # to keep the full matrix on disk. Pairs with fewer than two shared months
+    # or a flat profile over them correlate as NaN.
+    if products is not None:
+        matrix = matrix.loc[products]
+    values = matrix.to_numpy(np.float64)
+    valid = ~np.isnan(values)
+    # Centering on each product's own mean leaves the correlations unchanged
+    # and keeps the sums of squares small
+    with np.errstate(invalid='ignore'):
+        centered = values - np.nanmean(values, axis=1, keepdims=True)
+    centered = np.where(valid, centered, 0.0)
+    squares = centered * centered
+    mask = valid.astype(np.float64)
+
+    n = len(values)
+    if out is None:
+        out = np.empty((n, n), dtype=dtype)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        for other in range(start, n, block_size):
+            other_stop = min(other + block_size, n)
+            tile = _pairwise_correlation(centered[start:stop], squares[start:stop], mask[start:stop],
+                                         centered[other:other_stop], squares[other:other_stop], mask[other:other_stop])
+            out[start:stop, other:other_stop] = tile
+            out[other:other_stop, start:stop] = tile.T
+
+    return pd.DataFrame(out, index=matrix.index, columns=matrix.index)
+
+
+def _pairwise_correlation(x, xx, x_mask, y, yy, y_mask):
+    # Correlation of every row of x with every row of y over the months both
+    # have, from the per-pair count, sums and sums of squares and products
+    count = x_mask @ y_mask.T
+    sum_x = x @ y_mask.T
+    sum_y = x_mask @ y.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = x @ y.T - sum_x * sum_y / count
+        var_x = xx @ y_mask.T - sum_x * sum_x / count
+        var_y = x_mask @ yy.T - sum_y * sum_y / count
+        tile = covariance / np.sqrt(var_x * var_y)
+    tile[(count < 2) | (var_x <= 0) | (var_y <= 0)] = np.nan
+    return np.clip(tile, -1, 1)
@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+
+from calendar_dim import add_calendar_columns, parse_dates
+from instrument import span
+
+
+class Dimension:
+    # A dimension table addressed by row position. Keys are resolved to
+    # positions once (through a dense lookup array for integer keys) and every
+    # attribute is then fetched with a positional take.
+
+    def __init__(self, name, table, key):
+        keys = table[key]
+        if keys.isnull().any():
+            raise ValueError(f"{name}: key column '{key}' contains missing values")
+        duplicated = keys[keys.duplicated()].unique()
+        if len(duplicated):
+            raise ValueError(f"{name}: key column '{key}' is not unique, e.g. {list(duplicated[:5])}")
+
+        self.name = name
+        self.key = key
+        self.table = table.reset_index(drop=True)
+        self.attributes = [c for c in self.table.columns if c != key]
+        self._index = pd.Index(keys)
+        self._lookup = None
+        self._offset = 0
+        # Set by snowflake(): keys of this table that found no match in the folded dimension
+        self.unmatched_links = None
+
+        # Integer keys that are reasonably dense get a direct key -> position array
+        if pd.api.types.is_integer_dtype(keys) and len(keys):
+            low, high = int(keys.min()), int(keys.max())
+            if high - low + 1 <= 4 * len(keys) + 1024:
+                self._offset = low
+                self._lookup = np.full(high - low + 1, -1, dtype=np.intp)
+                self._lookup[keys.to_numpy() - low] = np.arange(len(keys))
+
+    def __len__(self):
+        return len(self.table)
+
+    def positions(self, keys):
+        # Row position of every key, -1 where the key has no match
+        keys = pd.Series(keys)
+        if self._lookup is not None and pd.api.types.is_integer_dtype(keys):
+            shifted = keys.to_numpy().astype(np.int64) - self._offset
+            inside = (shifted >= 0) & (shifted < len(self._lookup))
+            positions = np.full(len(shifted), -1, dtype=np.intp)
+            positions[inside] = self._lookup[shifted[inside]]
+            return positions
+        return self._index.get_indexer(keys)
+
+    def take(self, attribute, positions, index=None):
+        # Unmatched positions (-1) become missing values, exactly like a left merge
+        values = self.table[attribute].array.take(positions, allow_fill=True)
+        return pd.Series(values, index=index, name=attribute)
+
+    def snowflake(self, foreign_key, other):
+        # Fold a dimension that hangs off this one (e.g. Regions.state -> State
+        # Regions.State) into it. This costs one take per attribute over the
+        # small table, so the fact table only ever needs a single key.
+        clashes = set(other.attributes) & set(self.table.columns)
+        if clashes:
+            raise ValueError(f"{other.name} attributes clash with {self.name}: {sorted(clashes)}")
+
+        positions = other.positions(self.table[foreign_key])
+        table = self.table.copy()
+        for attribute in other.attributes:
+            table[attribute] = other.take(attribute, positions, index=table.index)
+        merged = Dimension(self.name, table, self.key)
+        merged.unmatched_links = {
+            'join': f'{self.name}.{foreign_key} -> {other.name}.{other.key}',
+            'keys': self.table.loc[positions == -1, foreign_key].unique().tolist(),
+            'rows': np.flatnonzero(positions == -1),
+        }
+        return merged
+
+
+class StarSchema:
+    # A fact table plus integer-keyed dimensions. Dimension attributes are only
+    # resolved when asked for, by a positional take on the foreign key, so the
+    # fact table is never copied once per join.
+
+    def __init__(self, fact):
+        self.fact = fact
+        self._dimensions = {}
+        self._owners = {}
+        self._positions = {}
+
+    def join(self, foreign_key, dimension):
+        clashes = [a for a in dimension.attributes if a in self._owners or a in self.fact.columns]
+        if clashes:
+            raise ValueError(f"{dimension.name} attributes clash with existing columns: {clashes}")
+        self._dimensions[foreign_key] = dimension
+        for attribute in dimension.attributes:
+            self._owners[attribute] = foreign_key
+        return self
+
+    @property
+    def attributes(self):
+        return list(self._owners)
+
+    def positions(self, foreign_key):
+        if foreign_key not in self._positions:
+            dimension = self._dimensions[foreign_key]
+            with span(f'join {foreign_key} -> {dimension.name}', 'join', rows_in=len(self.fact)) as s:
+                self._positions[foreign_key] = dimension.positions(self.fact[foreign_key])
+                s.rows_out = int((self._positions[foreign_key] >= 0).sum())
+        return self._positions[foreign_key]
+
+    def column(self, name, rows=None):
+        if name in self.fact.columns:
+            series = self.fact[name]
+            return series if rows is None else series.iloc[rows]
+        if name not in self._owners:
+            raise KeyError(f"'{name}' is neither a fact column nor a dimension attribute")
+        foreign_key = self._owners[name]
+        positions = self.positions(foreign_key)
+        index = self.fact.index
+        if rows is not None:
+            positions = positions[rows]
+            index = index[rows]
+        return self._dimensions[foreign_key].take(name, positions, index=index)
+
+    def frame(self, columns=None, rows=None):
+        # Materialize the requested fact columns and attributes (all by default)
+        if columns is None:
+            columns = list(self.fact.columns) + self.attributes
+        with span('materialize joined rows', 'join', rows_in=len(self.fact)) as s:
+            frame = pd.DataFrame({name: self.column(name, rows) for name in columns})
+            s.rows_out = len(frame)
+        return frame
+
+    def head(self, columns, n=5):
+        return self.frame(columns, rows=slice(0, n))
+
+    def unmatched(self):
+        # One row per join that loses keys. Under how='left' these rows would
+        # silently have become NaN.
+        report = []
+        for foreign_key, dimension in self._dimensions.items():
+            positions = self.positions(foreign_key)
+            missing = positions == -1
+            if missing.any():
+                report.append({
+                    'join': f'{foreign_key} -> {dimension.name}.{dimension.key}',
+                    'unmatched_rows': int(missing.sum()),
+                    'unmatched_keys': pd.unique(self.fact[foreign_key].to_numpy()[missing]).tolist(),
+                })
+            link = dimension.unmatched_links
+            if link is not None and len(link['rows']):
+                affected = np.isin(positions, link['rows'])
+                if affected.any():
+                    report.append({
+                        'join': link['join'],
+                        'unmatched_rows': int(affected.sum()),
+                        'unmatched_keys': link['keys'],
+                    })
+        return pd.DataFrame(report, columns=['join', 'unmatched_rows', 'unmatched_keys'])
+
+
+# Dimension attributes the analysis steps read from the joined sales rows
+SALES_ATTRIBUTES = ['state', 'Region', 'households', 'Product Name']
+
+
+def build_sales_schema(frames):
+    # Sales Orders with Regions (+ State Regions), Products and Customers,
+    # from the sheets returned by loader.load_workbook()
+    regions = Dimension('Regions', frames['Regions'], 'id')
+    state_regions = Dimension('State Regions', frames['State Regions'], 'State')
+    schema = StarSchema(frames['Sales Orders'])
+    schema.join('Delivery Region Index', regions.snowflake('state', state_regions))
+    schema.join('Product Description Index', Dimension('Products', frames['Products'], 'Index'))
+    schema.join('Customer Name Index', Dimension('Customers', frames['Customers'], 'Customer Index'))
+    return schema
+
+
+def add_derived_columns(sales):
+    # Profit and the order calendar used by the analysis steps, added in place
+    with span('derived columns', 'transform', rows_in=len(sales)):
+        sales['OrderDate'] = parse_dates(sales['OrderDate'])
+        sales['Profit'] = sales['Line Total'] - sales['Total Unit Cost']
+        # Year, Month, Quarter and Month_Name, once per distinct order date
+        add_calendar_columns(sales, 'OrderDate')
+    return sales
+
+
+def sales_rows(frames):
+    # Sales Orders joined with the attributes in SALES_ATTRIBUTES plus the
+    # derived columns, i.e. the rows every analysis step works on
+    schema = build_sales_schema(frames)
+    return add_derived_columns(schema.frame(frames['Sales Orders'].columns.tolist() + SALES_ATTRIBUTES))
@@ -0,0 +1,117 @@
+import argparse
+
+import pandas as pd
+
+from cube import SalesCube
+from distinct import ExactDistinct, HLLDistinct
+from hll import DEFAULT_PRECISION
+from incremental import DIMENSION_SHEETS
+from loader import SHEETS, load_workbook
+from metrics import all_tables
+from star_schema import sales_rows
+
+DEFAULT_MEMORY_MB = 256
+
+# Peak memory of one chunk relative to its raw size: the joined and derived
+# columns plus the groupby working set of the cube build
+WORKING_SET_FACTOR = 6
+SAMPLE_ROWS = 1000
+
+
+class PartialAggregates:
+    # Everything Steps 3-12 need, folded chunk by chunk: the aggregate cube
+    # and the distinct order counts. Two partials over disjoint rows merge
+    # into the partial of their union.
+
+    def __init__(self, distinct_factory=ExactDistinct):
+        self.cube = None
+        self.distinct = distinct_factory()
+        self.rows = 0
+
+    def update(self, rows):
+        chunk_cube = SalesCube.build(rows)
+        self.cube = chunk_cube if self.cube is None else self.cube.merge(chunk_cube)
+        self.distinct.add(rows)
+        self.rows += len(rows)
+        return self
+
+    def merge(self, other):
+        if other.cube is not None:
+            self.cube = other.cube if self.cube is None else self.cube.merge(other.cube)
+        self.distinct.merge(other.distinct)
+        self.rows += other.rows
+        return self
+
+    def tables(self):
+        return all_tables(self.cube, self.distinct.counts())
+
+
+def _read_sample(path, nrows):
+    if path.endswith('.csv'):
+        return pd.read_csv(path, nrows=nrows, parse_dates=['OrderDate'])
+    import pyarrow.parquet as pq
+    return next(pq.ParquetFile(path).iter_batches(batch_size=nrows)).to_pandas()
+
+
+def rows_per_chunk(path, memory_mb=DEFAULT_MEMORY_MB):
+    # Chunk size that keeps one chunk's working set under memory_mb
+    sample = _read_sample(path, SAMPLE_ROWS)
+    bytes_per_row = sample.memory_usage(deep=True, index=False).sum() / max(len(sample), 1)
+    return max(1000, int(memory_mb * 2**20 / (bytes_per_row * WORKING_SET_FACTOR)))
+
+
+def iter_chunks(path, chunk_rows):
+    # Sales Orders rows from a CSV or Parquet export, chunk_rows at a time
+    if path.endswith('.csv'):
+        yield from pd.read_csv(path, chunksize=chunk_rows, parse_dates=['OrderDate'])
+    elif path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unsupported Sales Orders export '{path}', expected .csv or .parquet")
+
+
+def load_dimensions(workbook):
+    sheets = [(name, header) for name, header in SHEETS if name in DIMENSION_SHEETS]
+    frames, _ = load_workbook(workbook, sheets=sheets)
+    return frames
+
+
+def run_chunked(path, dimensions, memory_mb=DEFAULT_MEMORY_MB, chunk_rows=None, distinct_factory=ExactDistinct):
+    # Stream a Sales Orders export through the join and fold every chunk into
+    # the partial aggregates; only one chunk of rows is in memory at a time
+    if chunk_rows is None:
+        chunk_rows = rows_per_chunk(path, memory_mb)
+    partial = PartialAggregates(distinct_factory)
+    frames = dict(dimensions)
+    for chunk in iter_chunks(path, chunk_rows):
+        frames['Sales Orders'] = chunk
+        partial.update(sales_rows(frames))
+    return partial
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the Steps 3-12 metrics over a Sales Orders export in bounded memory.')
+    parser.add_argument('orders', help='CSV or Parquet export of the Sales Orders sheet')
+    parser.add_argument('--workbook', default='Regional Sales Dataset.xlsx', help='workbook holding the dimension sheets')
+    parser.add_argument('--memory-mb', type=float, default=DEFAULT_MEMORY_MB, help='memory budget for one chunk')
+    parser.add_argument('--chunk-rows', type=int, help='fixed chunk size (overrides --memory-mb)')
+    parser.add_argument('--distinct', choices=['exact', 'hll'], default='exact',
+                        help='count distinct orders exactly or with fixed-size HyperLogLog sketches')
+    parser.add_argument('--precision', type=int, default=DEFAULT_PRECISION, help='HyperLogLog precision')
+    args = parser.parse_args()
+
+    if args.distinct == 'exact':
+        distinct_factory = ExactDistinct
+    else:
+        distinct_factory = lambda: HLLDistinct(args.precision)  # noqa: E731
+    partial = run_chunked(args.orders, load_dimensions(args.workbook), args.memory_mb, args.chunk_rows, distinct_factory)
+    print(f"Aggregated {partial.rows} sales rows into {len(partial.cube)} cube cells")
+    for name, table in partial.tables().items():
+        print(f"\n{name}:")
+        print(table)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Schema-compatible synthetic Regional Sales data at any scale. Dimension
+# sizes follow the real workbook (30 products, 175 customers, ~1000 cities);
+# the order lines are skewed the way real sales are:
+#
+#   products   Zipf-like popularity (a few products carry most lines)
+#   regions    cities drawn in proportion to a long-tailed population
+#   customers  mildly Zipf-like
+#   months     a seasonal curve peaking in late spring with a December bump
+#   orders     1-6 lines sharing order number, date, customer, channel, city
+#
+# Sales Orders are generated in chunks, so 50M lines never need to be in
+# memory at once when written to Parquet or CSV.
+
+WORKBOOK_NAME = 'Regional Sales Dataset.xlsx'
+EXCEL_MAX_ROWS = 1_048_575
+DEFAULT_CHUNK_ROWS = 1_000_000
+
+# (state code, state, census region)
+STATES = [
+    ('AL', 'Alabama', 'South'), ('AK', 'Alaska', 'West'), ('AZ', 'Arizona', 'West'),
+    ('AR', 'Arkansas', 'South'), ('CA', 'California', 'West'), ('CO', 'Colorado', 'West'),
+    ('CT', 'Connecticut', 'Northeast'), ('DE', 'Delaware', 'South'), ('DC', 'District of Columbia', 'South'),
+    ('FL', 'Florida', 'South'), ('GA', 'Georgia', 'South'), ('HI', 'Hawaii', 'West'),
+    ('ID', 'Idaho', 'West'), ('IL', 'Illinois', 'Midwest'), ('IN', 'Indiana', 'Midwest'),
+    ('IA', 'Iowa', 'Midwest'), ('KS', 'Kansas', 'Midwest'), ('KY', 'Kentucky', 'South'),
+    ('LA', 'Louisiana', 'South'), ('ME', 'Maine', 'Northeast'), ('MD', 'Maryland', 'South'),
+    ('MA', 'Massachusetts', 'Northeast'), ('MI', 'Michigan', 'Midwest'), ('MN', 'Minnesota', 'Midwest'),
+    ('MS', 'Mississippi', 'South'), ('MO', 'Missouri', 'Midwest'), ('MT', 'Montana', 'West'),
+    ('NE', 'Nebraska', 'Midwest'), ('NV', 'Nevada', 'West'), ('NH', 'New Hampshire', 'Northeast'),
+    ('NJ', 'New Jersey', 'Northeast'), ('NM', 'New Mexico', 'West'), ('NY', 'New York', 'Northeast'),
+    ('NC', 'North Carolina', 'South'), ('ND', 'North Dakota', 'Midwest'), ('OH', 'Ohio', 'Midwest'),
+    ('OK', 'Oklahoma', 'South'), ('OR', 'Oregon', 'West'), ('PA', 'Pennsylvania', 'Northeast'),
+    ('RI', 'Rhode Island', 'Northeast'), ('SC', 'South Carolina', 'South'), ('SD', 'South Dakota', 'Midwest'),
+    ('TN', 'Tennessee', 'South'), ('TX', 'Texas', 'South'), ('UT', 'Utah', 'West'),
+    ('VT', 'Vermont', 'Northeast'), ('VA', 'Virginia', 'South'), ('WA', 'Washington', 'West'),
+    ('WV', 'West Virginia', 'South'), ('WI', 'Wisconsin', 'Midwest'), ('WY', 'Wyoming', 'West'),
+]
+
+CHANNELS = ['Wholesale', 'Distributor', 'Export']
+CHANNEL_WEIGHTS = [0.54, 0.31, 0.15]
+WAREHOUSES = ['AXW291', 'FLR025', 'GUT930', 'NXH382']
+WAREHOUSE_WEIGHTS = [0.37, 0.26, 0.22, 0.15]
+
+# Relative order volume per calendar month, January first
+MONTH_WEIGHTS = [0.82, 0.85, 0.95, 1.05, 1.12, 1.15, 1.08, 1.00, 0.96, 0.98, 1.02, 1.20]
+
+START_DATE = '2014-01-01'
+END_DATE = '2017-12-31'
+
+
+def _zipf_weights(n, exponent, rng):
+    # Zipf-like weights in random rank order, summing to 1
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return rng.permutation(weights / weights.sum())
+
+
+class SyntheticSales:
+    # A reproducible synthetic dataset: dimensions and skew are fixed by the
+    # seed, Sales Orders can then be drawn in any number of lines
+
+    def __init__(self, seed=0, products=30, customers=175, cities=994, start=START_DATE, end=END_DATE):
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.n_products = products
+        self.n_customers = customers
+        self.n_cities = cities
+
+        self.product_weights = _zipf_weights(products, 1.1, rng)
+        self.base_prices = np.exp(rng.uniform(np.log(150), np.log(4500), products)).round(1)
+        self.cost_ratios = rng.uniform(0.45, 0.85, products)
+        self.customer_weights = _zipf_weights(customers, 0.6, rng)
+
+        state_weights = rng.lognormal(0, 1.0, len(STATES))
+        self.city_states = rng.choice(len(STATES), cities, p=state_weights / state_weights.sum())
+        self.city_population = (rng.lognormal(10.5, 0.9, cities)).astype(np.int64) + 1000
+        self.city_weights = self.city_population / self.city_population.sum()
+
+        days = pd.date_range(start, end, freq='D')
+        growth = np.linspace(1.0, 1.25, len(days))
+        day_weights = np.asarray(MONTH_WEIGHTS)[days.month - 1] * growth
+        self.days = days.values
+        self.day_weights = day_weights / day_weights.sum()
+
+    def dimensions(self, lines):
+        # Customers, Products, Regions, State Regions and 2017 Budgets; the
+        # budgets are sized to the expected yearly sales of `lines` lines
+        rng = np.random.default_rng(self.seed + 1)
+        products = pd.DataFrame({
+            'Index': np.arange(1, self.n_products + 1),
+            'Product Name': [f'Product {i}' for i in range(1, self.n_products + 1)],
+        })
+        customers = pd.DataFrame({
+            'Customer Index': np.arange(1, self.n_customers + 1),
+            'Customer Names': [f'Customer {i} Ltd' for i in range(1, self.n_customers + 1)],
+        })
+        n = self.n_cities
+        households = (self.city_population / rng.uniform(2.3, 3.0, n)).astype(np.int64)
+        regions = pd.DataFrame({
+            'id': np.arange(1, n + 1),
+            'name': [f'City {i}' for i in range(1, n + 1)],
+            'county': [f'County {i}' for i in range(1, n + 1)],
+            'state_code': [STATES[s][0] for s in self.city_states],
+            'state': [STATES[s][1] for s in self.city_states],
+            'type': 'City',
+            'latitude': rng.uniform(25, 49, n).round(5),
+            'longitude': rng.uniform(-124, -67, n).round(5),
+            'area_code': rng.integers(201, 990, n),
+            'population': self.city_population,
+            'households': households,
+            'median_income': rng.integers(25_000, 120_000, n),
+            'land_area': rng.integers(5_000_000, 1_000_000_000, n),
+            'water_area': rng.integers(0, 50_000_000, n),
+            'time_zone': 'America/Chicago',
+        })
+        state_regions = pd.DataFrame(STATES, columns=['State Code', 'State', 'Region'])
+
+        years = (self.days[-1] - self.days[0]) / np.timedelta64(365, 'D')
+        expected_sales = lines / max(years, 1) * self.product_weights * self.base_prices * 8
+        budgets = pd.DataFrame({
+            'Product Name': products['Product Name'],
+            '2017 Budgets': (expected_sales * rng.uniform(0.9, 1.15, self.n_products)).round(2),
+        })
+        return {
+            'Customers': customers,
+            'Products': products,
+            'Regions': regions,
+            'State Regions': state_regions,
+            '2017 Budgets': budgets,
+        }
+
+    def iter_orders(self, lines, chunk_rows=DEFAULT_CHUNK_ROWS):
+        # Sales Orders rows, chunk_rows at a time, `lines` in total
+        rng = np.random.default_rng(self.seed + 2)
+        first_order = 100_001
+        produced = 0
+        while produced < lines:
+            size = min(chunk_rows, lines - produced)
+            lines_per_order = rng.integers(1, 7, size)
+            n_orders = int(np.searchsorted(np.cumsum(lines_per_order), size)) + 1
+            lines_per_order = lines_per_order[:n_orders]
+            lines_per_order[-1] -= lines_per_order.sum() - size
+            order = np.repeat(np.arange(n_orders), lines_per_order)
+
+            order_ids = first_order + np.arange(n_orders)
+            order_dates = rng.choice(self.days, n_orders, p=self.day_weights)
+            customers = rng.choice(self.n_customers, n_orders, p=self.customer_weights) + 1
+            channels = rng.choice(len(CHANNELS), n_orders, p=CHANNEL_WEIGHTS)
+            warehouses = rng.choice(len(WAREHOUSES), n_orders, p=WAREHOUSE_WEIGHTS)
+            cities = rng.choice(self.n_cities, n_orders, p=self.city_weights) + 1
+
+            products = rng.choice(self.n_products, size, p=self.product_weights)
+            quantity = rng.integers(1, 16, size)
+            unit_price = (self.base_prices[products] * rng.uniform(0.9, 1.1, size)).round(1)
+            line_total = (quantity * unit_price).round(2)
+            unit_cost = (line_total * self.cost_ratios[products] * rng.uniform(0.9, 1.1, size)).round(3)
+
+            yield pd.DataFrame({
+                'OrderNumber': 'SO - ' + pd.Series(order_ids[order]).astype(str).str.zfill(6),
+                'OrderDate': order_dates[order],
+                'Customer Name Index': customers[order],
+                'Channel': np.asarray(CHANNELS, dtype=object)[channels[order]],
+                'Currency Code': 'USD',
+                'Warehouse Code': np.asarray(WAREHOUSES, dtype=object)[warehouses[order]],
+                'Delivery Region Index': cities[order],
+                'Product Description Index': products + 1,
+                'Order Quantity': quantity,
+                'Unit Price': unit_price,
+                'Line Total': line_total,
+                'Total Unit Cost': unit_cost,
+            })
+            first_order += n_orders
+            produced += size
+
+    def frames(self, lines):
+        # Every sheet in memory, shaped like loader.load_workbook()'s frames
+        frames = {'Sales Orders': pd.concat(list(self.iter_orders(lines)), ignore_index=True)}
+        frames.update(self.dimensions(lines))
+        return {name: frames[name] for name in
+                ['Sales Orders', 'Customers', 'Products', 'Regions', 'State Regions', '2017 Budgets']}
+
+
+def write_dataset(out_dir, lines, fmt='parquet', seed=0, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # Write the dimension sheets to a workbook in out_dir and the Sales Orders
+    # to sales_orders.<fmt>. Up to EXCEL_MAX_ROWS lines, the workbook also gets
+    # the Sales Orders sheet, so eda.py can run on it unchanged.
+    os.makedirs(out_dir, exist_ok=True)
+    sales = SyntheticSales(seed)
+    orders_path = os.path.join(out_dir, f'sales_orders.{fmt}')
+    if fmt == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        for chunk in sales.iter_orders(lines, chunk_rows):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(orders_path, table.schema)
+            writer.write_table(table)
+        if writer is not None:
+            writer.close()
+    elif fmt == 'csv':
+        for i, chunk in enumerate(sales.iter_orders(lines, chunk_rows)):
+            chunk.to_csv(orders_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    else:
+        raise ValueError(f"Unsupported format '{fmt}', expected 'parquet' or 'csv'")
+
+    workbook = os.path.join(out_dir, WORKBOOK_NAME)
+    with pd.ExcelWriter(workbook) as writer:
+        if lines <= EXCEL_MAX_ROWS:
+            pd.concat(list(sales.iter_orders(lines, chunk_rows)), ignore_index=True).to_excel(
+                writer, sheet_name='Sales Orders', index=False)
+        for name, frame in sales.dimensions(lines).items():
+            if name == 'State Regions':
+                # The real sheet has a title row above its header
+                pd.DataFrame([['State Regions']]).to_excel(writer, sheet_name=name, index=False, header=False)
+                frame.to_excel(writer, sheet_name=name, index=False, startrow=1)
+            else:
+                frame.to_excel(writer, sheet_name=name, index=False)
+    return workbook, orders_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Regional Sales dataset.')
+    parser.add_argument('out_dir')
+    parser.add_argument('--lines', type=float, default=100_000, help='number of Sales Orders lines (e.g. 1e6)')
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet', help='Sales Orders export format')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    lines = int(args.lines)
+    workbook, orders_path = write_dataset(args.out_dir, lines, args.format, args.seed, args.chunk_rows)
+    print(f"Wrote {lines} Sales Orders lines to {orders_path}")
+    if lines <= EXCEL_MAX_ROWS:
+        print(f"Wrote all sheets to {workbook}")
+    else:
+        print(f"Wrote the dimension sheets to {workbook} (too many lines for an Excel sheet; "
+              f"run streaming.py on {orders_path})")
+
+
+if __name__ == '__main__':
+    main()
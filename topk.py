@@ -0,0 +1,129 @@
+import argparse
+import heapq
+import time
+
+import numpy as np
+import pandas as pd
+
+# Top-K by partial selection. A full sort_values(ascending=False).head(k) is
+# O(n log n); np.partition finds the k-th largest value in O(n) and only the
+# k survivors are sorted. Ties go to the earlier position and NaN sorts last,
+# so the results equal sort_values(ascending=False).head(k) and
+# nlargest(k, keep='first').
+#
+# StreamingTopK keeps a k-item heap over scores arriving in chunks (e.g. per
+# SKU totals produced chunk by chunk); memory stays O(k) however many keys
+# pass through. `python topk.py` times both against a full sort.
+
+
+def top_k(values, k):
+    # Positions of the k largest values, largest first
+    values = np.asarray(values, dtype=np.float64)
+    k = min(k, len(values))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    nan = np.isnan(values)
+    valid = np.flatnonzero(~nan)
+    if len(valid) <= k:
+        ordered = valid[np.lexsort((valid, -values[valid]))]
+        return np.concatenate([ordered, np.flatnonzero(nan)[:k - len(valid)]])
+    candidates = values[valid]
+    threshold = np.partition(candidates, len(candidates) - k)[len(candidates) - k]
+    above = valid[candidates > threshold]
+    ties = valid[candidates == threshold][:k - len(above)]
+    chosen = np.concatenate([above, ties])
+    return chosen[np.lexsort((chosen, -values[chosen]))]
+
+
+def top_k_series(series, k):
+    return series.iloc[top_k(series.to_numpy(), k)]
+
+
+def top_k_rows(frame, column, k):
+    return frame.iloc[top_k(frame[column].to_numpy(), k)]
+
+
+def rankings(frame, columns, k):
+    # {column: the k largest values of that column} for several rankings of
+    # the same table, each by its own partial selection
+    return {column: top_k_series(frame[column], k) for column in columns}
+
+
+class StreamingTopK:
+    # The k highest scores seen over any number of update() calls. Each key
+    # should be offered once with its final score; on equal scores the key
+    # offered first wins.
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []   # (score, -arrival, key), smallest kept score on top
+        self._seen = 0
+
+    def update(self, keys, scores):
+        scores = np.asarray(scores, dtype=np.float64)
+        keys = np.asarray(keys)
+        # Only the chunk's own top k can enter the overall top k
+        for i in top_k(scores, self.k):
+            if np.isnan(scores[i]):
+                continue
+            item = (scores[i], -(self._seen + int(i)), keys[i])
+            if len(self._heap) < self.k:
+                heapq.heappush(self._heap, item)
+            elif item[:2] > self._heap[0][:2]:
+                heapq.heapreplace(self._heap, item)
+        self._seen += len(scores)
+        return self
+
+    def merge(self, other):
+        # Arrival order of `other` is taken to follow this one's
+        for score, arrival, key in other._heap:
+            item = (score, arrival - self._seen, key)
+            if len(self._heap) < self.k:
+                heapq.heappush(self._heap, item)
+            elif item[:2] > self._heap[0][:2]:
+                heapq.heapreplace(self._heap, item)
+        self._seen += other._seen
+        return self
+
+    def result(self, name=None):
+        items = sorted(self._heap, key=lambda item: item[:2], reverse=True)
+        return pd.Series([score for score, _, _ in items], index=[key for _, _, key in items],
+                         name=name, dtype=np.float64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare partial top-K selection with a full sort.')
+    parser.add_argument('--skus', type=int, default=500_000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--chunk-rows', type=int, default=50_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    sales = pd.Series(rng.lognormal(10, 2, args.skus).round(2),
+                      index=pd.Index([f'SKU {i}' for i in range(args.skus)], name='Product Name'))
+
+    start = time.perf_counter()
+    expected = sales.sort_values(ascending=False).head(args.k)
+    sort_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    selected = top_k_series(sales, args.k)
+    select_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    streaming = StreamingTopK(args.k)
+    for offset in range(0, args.skus, args.chunk_rows):
+        chunk = sales.iloc[offset:offset + args.chunk_rows]
+        streaming.update(chunk.index.to_numpy(), chunk.to_numpy())
+    streamed = streaming.result()
+    stream_seconds = time.perf_counter() - start
+
+    print(f"{args.skus} SKUs, top {args.k}:")
+    print(f"  full sort          {sort_seconds * 1000:8.1f} ms")
+    print(f"  partial selection  {select_seconds * 1000:8.1f} ms  same result: {selected.equals(expected)}")
+    print(f"  streaming heap     {stream_seconds * 1000:8.1f} ms  same result: "
+          f"{list(streamed.index) == list(expected.index)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+from instrument import span
+from loader import BUDGET_SHEET
+
+# Data profiling and join checks for the workbook sheets, run on the loaded
+# frames before anything is joined.
+#
+# Profile: every column is hashed once (pd.factorize), which gives its nulls
+# (code -1) and distinct values; min/max and the dtype anomalies below are
+# then worked out on the distinct values only, so a 1M-row column with a few
+# hundred values costs one pass plus a few hundred checks:
+#
+#   mixed types          an object column holding e.g. both ints and strings
+#   numbers as text      a text column whose values all parse as numbers
+#   surrounding spaces   text values with leading/trailing whitespace
+#   case variants        values differing only in case ('West' / 'west')
+#   infinite values      +/-inf in a float column
+#   all missing          no value at all
+#
+# Joins: for every foreign key of the star schema (and the snowflaked
+# Regions.state -> State Regions.State link) the dimension keys are counted
+# and the foreign keys looked up once, which gives null and orphan keys
+# (rows a left merge would leave without attributes), duplicated dimension
+# keys and the row count a merge would produce (more rows than the fact
+# table means it would duplicate sales), the cardinality and the unused
+# dimension keys.
+#
+# Join problems are errors, profile anomalies warnings. With strict=True the
+# join errors raise ValidationError before the (slower) profile is built, so
+# a production batch stops before it joins or aggregates anything. Missing or
+# duplicated keys of a star-schema dimension (the dimension side of JOINS)
+# raise ValidationError whatever `strict` says: the joins look rows up by
+# unique dimension key, so they could not run.
+
+# (table, foreign key, dimension table, dimension key), as joined by
+# star_schema.build_sales_schema; budget sheets are added per workbook
+JOINS = [
+    ('Sales Orders', 'Delivery Region Index', 'Regions', 'id'),
+    ('Regions', 'state', 'State Regions', 'State'),
+    ('Sales Orders', 'Product Description Index', 'Products', 'Index'),
+    ('Sales Orders', 'Customer Name Index', 'Customers', 'Customer Index'),
+]
+SAMPLE_KEYS = 10
+
+
+class ValidationError(Exception):
+    def __init__(self, report):
+        errors = report.errors()
+        super().__init__(f"{len(errors)} validation error(s):\n  " + '\n  '.join(errors['Problem']))
+        self.report = report
+
+
+def _label(value):
+    # Min/max as text, so one column can hold numbers, dates and strings
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return str(value)
+
+
+def _sample(values):
+    values = list(values)
+    text = ', '.join(str(v) for v in values[:SAMPLE_KEYS])
+    return text + (', ...' if len(values) > SAMPLE_KEYS else '')
+
+
+def _text_values(uniques):
+    return [v for v in uniques if isinstance(v, str)]
+
+
+def column_anomalies(series, uniques):
+    # Anomalies of a column, found on its distinct non-null values
+    anomalies = []
+    if not len(uniques):
+        return ['all missing'] if len(series) else []
+    if series.dtype == object:
+        types = sorted({type(v).__name__ for v in uniques})
+        if len(types) > 1:
+            anomalies.append(f"mixed types ({', '.join(types)})")
+    if pd.api.types.is_float_dtype(series.dtype):
+        infinite = int(np.isinf(np.asarray(uniques, dtype=np.float64)).sum())
+        if infinite:
+            anomalies.append(f'{infinite} infinite values')
+    text = _text_values(uniques) if pd.api.types.is_string_dtype(series.dtype) else []
+    if text:
+        text = pd.Series(text, dtype=object)
+        if pd.to_numeric(text, errors='coerce').notna().all():
+            anomalies.append('numbers stored as text')
+        padded = text[text.str.strip() != text]
+        if len(padded):
+            anomalies.append(f"{len(padded)} values with surrounding spaces, e.g. {padded.iloc[0]!r}")
+        folded = text.str.strip().str.casefold()
+        variants = folded[folded.duplicated(keep=False)]
+        if len(variants) and len(variants) > len(variants.unique()):
+            examples = text[folded == variants.iloc[0]].tolist()
+            anomalies.append(f"{len(variants.unique())} values differ only in case or spaces, e.g. {examples[:2]}")
+    return anomalies
+
+
+def profile_column(series):
+    codes, uniques = pd.factorize(series)
+    nulls = int(np.count_nonzero(codes < 0))
+    low = high = None
+    if len(uniques):
+        if isinstance(uniques, pd.Index) and not pd.api.types.is_string_dtype(uniques.dtype):
+            low, high = uniques.min(), uniques.max()
+        else:
+            text = _text_values(uniques)
+            if len(text) == len(uniques):
+                low, high = min(text), max(text)
+    return {
+        'Dtype': str(series.dtype),
+        'Rows': len(series),
+        'Nulls': nulls,
+        'Null_%': nulls / len(series) * 100 if len(series) else 0.0,
+        'Distinct': len(uniques),
+        'Min': _label(low),
+        'Max': _label(high),
+        'Anomalies': '; '.join(column_anomalies(series, uniques)),
+    }
+
+
+def profile_table(name, frame):
+    # One row per column of the frame
+    with span(f'profile {name}', 'validate', rows_in=len(frame)) as s:
+        rows = [{'Table': name, 'Column': str(column), **profile_column(frame[column])}
+                for column in frame.columns]
+        s.rows_out = len(rows)
+    return rows
+
+
+def _key_kind(series):
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return 'number'
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return 'date'
+    return 'text'
+
+
+def check_join(frames, table, foreign_key, dimension, key):
+    # (one join_checks row, [problems]) for table.foreign_key -> dimension.key
+    name = f'{table}.{foreign_key} -> {dimension}.{key}'
+    for sheet, column in ((table, foreign_key), (dimension, key)):
+        if sheet not in frames or column not in frames[sheet].columns:
+            missing = f"sheet '{sheet}'" if sheet not in frames else f"column '{column}'"
+            return {'Join': name, 'Status': 'missing'}, [('error', sheet, column, f'{name}: {missing} not found')]
+
+    fact = frames[table][foreign_key]
+    keys = frames[dimension][key]
+    problems = []
+    with span(f'check join {name}', 'validate', rows_in=len(fact)):
+        if _key_kind(fact) != _key_kind(keys):
+            problems.append(('error', table, foreign_key,
+                             f'{name}: key types differ ({fact.dtype} vs {keys.dtype}), no row can match'))
+        codes, uniques = pd.factorize(keys)
+        dimension_nulls = int(np.count_nonzero(codes < 0))
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        duplicated = uniques[counts > 1]
+
+        positions = pd.Index(uniques).get_indexer(fact)
+        matched = positions >= 0
+        nulls = fact.isna().to_numpy()
+        orphans = ~matched & ~nulls
+        orphan_keys = pd.unique(fact.to_numpy()[orphans])
+        # A left merge keeps unmatched rows once and repeats matched rows once
+        # per duplicate of their key
+        merged_rows = int(counts[positions[matched]].sum() + np.count_nonzero(~matched))
+        used = np.zeros(len(uniques), dtype=bool)
+        used[positions[matched]] = True
+
+    if dimension_nulls:
+        problems.append(('error', dimension, key, f'{name}: {dimension_nulls} missing dimension keys'))
+    if len(duplicated):
+        problems.append(('error', dimension, key,
+                         f'{name}: {len(duplicated)} duplicated dimension keys ({_sample(duplicated)}); '
+                         f'a merge would turn {len(fact)} rows into {merged_rows}'))
+    if nulls.any():
+        problems.append(('error', table, foreign_key, f'{name}: {int(nulls.sum())} rows without a key'))
+    if len(orphan_keys):
+        problems.append(('error', table, foreign_key,
+                         f'{name}: {int(orphans.sum())} rows with {len(orphan_keys)} keys not in '
+                         f'{dimension} ({_sample(orphan_keys)})'))
+
+    fact_unique = not fact[matched].duplicated().any()
+    cardinality = f"{'one' if fact_unique else 'many'}-to-{'many' if len(duplicated) else 'one'}"
+    row = {
+        'Join': name,
+        'Status': 'ok' if not problems else 'error',
+        'Cardinality': cardinality,
+        'Rows': len(fact),
+        'Matched_Rows': int(matched.sum()),
+        'Null_Key_Rows': int(nulls.sum()),
+        'Orphan_Rows': int(orphans.sum()),
+        'Orphan_Keys': _sample(orphan_keys),
+        'Duplicate_Dimension_Keys': len(duplicated),
+        'Rows_After_Join': merged_rows,
+        'Unused_Dimension_Keys': int(len(uniques) - used.sum()),
+    }
+    return row, problems
+
+
+def workbook_joins(frames):
+    # JOINS plus Product Name -> Products for every budget sheet
+    return JOINS + [(name, 'Product Name', 'Products', 'Product Name')
+                    for name in frames if BUDGET_SHEET.match(name)]
+
+
+class ValidationReport:
+
+    def __init__(self, joins, problems, profile=None):
+        self.joins = joins          # one row per checked join
+        self.problems = problems    # Severity, Table, Column, Problem
+        self.profile = profile      # one row per sheet column (None if not profiled)
+
+    def errors(self):
+        return self.problems[self.problems['Severity'] == 'error']
+
+    def warnings(self):
+        return self.problems[self.problems['Severity'] == 'warning']
+
+    @property
+    def ok(self):
+        return not len(self.errors())
+
+    def tables(self):
+        tables = {'join_checks': self.joins, 'validation_problems': self.problems}
+        if self.profile is not None:
+            tables['data_profile'] = self.profile
+        return tables
+
+    def to_dict(self):
+        return {name: json.loads(table.to_json(orient='records')) for name, table in self.tables().items()}
+
+
+def _problem_frame(problems):
+    return pd.DataFrame(problems, columns=['Severity', 'Table', 'Column', 'Problem'])
+
+
+def validate_workbook(frames, strict=False, joins=None):
+    # Check the joins, then profile every sheet; returns a ValidationReport.
+    # strict=True raises ValidationError on any join error, before profiling;
+    # unjoinable dimension keys raise it in any case.
+    joins = workbook_joins(frames) if joins is None else joins
+    dimension_keys = {(dimension, key) for _, _, dimension, key in JOINS}
+    join_rows = []
+    problems = []
+    for table, foreign_key, dimension, key in joins:
+        row, found = check_join(frames, table, foreign_key, dimension, key)
+        join_rows.append(row)
+        problems.extend(found)
+    report = ValidationReport(pd.DataFrame(join_rows), _problem_frame(problems))
+    unjoinable = [p for p in problems if p[0] == 'error' and (p[1], p[2]) in dimension_keys]
+    if unjoinable or (strict and not report.ok):
+        raise ValidationError(report)
+
+    profile = []
+    for name, frame in frames.items():
+        for row in profile_table(name, frame):
+            profile.append(row)
+            for anomaly in filter(None, row['Anomalies'].split('; ')):
+                problems.append(('warning', name, row['Column'], anomaly))
+    return ValidationReport(report.joins, _problem_frame(problems), pd.DataFrame(profile))
+
+
+def main():
+    from loader import load_workbook, workbook_sheets
+
+    parser = argparse.ArgumentParser(description='Profile the workbook sheets and check their join keys.')
+    parser.add_argument('--workbook', default='Regional Sales Dataset.xlsx')
+    parser.add_argument('--strict', action='store_true', help='stop before profiling if a join check fails')
+    parser.add_argument('--json', help='write the report to this JSON file')
+    args = parser.parse_args()
+
+    frames, _ = load_workbook(args.workbook, workbook_sheets(args.workbook))
+    try:
+        report = validate_workbook(frames, strict=args.strict)
+    except ValidationError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.max_colwidth', 60):
+        print(report.profile.round(2).to_string(index=False))
+        print()
+        print(report.joins.to_string(index=False))
+        if len(report.problems):
+            print()
+            print(report.problems.to_string(index=False))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report.to_dict(), f, indent=2)
+    sys.exit(0 if report.ok else 1)
+
+
+if __name__ == '__main__':
+    main()